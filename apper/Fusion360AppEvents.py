@@ -15,17 +15,29 @@ import traceback
 
 import threading
 import json
+from concurrent.futures import wait
 
+from .Fusion360ErrorSink import report_error
+from .Fusion360WorkerPool import get_default_worker_pool
+
+# Handlers are kept by the event objects that own them
 handlers = []
 
 
 # The class for the new thread.
 class Fusion360CustomThread:
-    """Creates a new Custom Event handler and a new thread
+    """Creates a new Custom Event handler and runs run_in_thread in a worker thread
+
+    The function runs in the worker pool of the FusionApp, see FusionApp.get_worker_pool.
 
     Args:
         event_id: Unique id, can be used by other functions to trigger the event
+        auto_start: Whether run_in_thread starts immediately
     """
+
+    # Seconds restart_thread waits for the previous run to return
+    thread_join_timeout = 2.0
+
     def __init__(self, event_id, auto_start=True):
         self.event_id = event_id
         self.thread = None
@@ -41,16 +53,12 @@ class Fusion360CustomThread:
             custom_event = app.registerCustomEvent(event_id)
             on_thread_event = _CustomThreadEventHandler(self.custom_event_received)
             custom_event.add(on_thread_event)
-            handlers.append(on_thread_event)
+            self.custom_event_handler = on_thread_event
 
-            # create and start the new thread
             self.stop_flag = threading.Event()
 
-            self.thread = _FusionThread(self.event_id, self.run_in_thread, self.stop_flag)
-            self.thread.daemon = True
-
             if auto_start:
-                self.thread.start()
+                self.start_thread()
 
         except Exception as e:
             ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -78,19 +86,24 @@ class Fusion360CustomThread:
         app.fireCustomEvent(self.event_id, json.dumps(args))
 
     def start_thread(self):
-        if not self.stop_flag:
-            pass
-        self.thread.start()
+        """Submits run_in_thread to the worker pool, does nothing if it is already running"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.thread = _FusionThread(self.event_id, self.run_in_thread, self.stop_flag)
+        self.thread.start(_get_worker_pool(self.fusion_app))
 
     def restart_thread(self):
+        """Stops the current run of run_in_thread, waits up to thread_join_timeout seconds for it and starts it again
+        """
         self.stop_flag.set()
+        if self.thread is not None:
+            self.thread.join(self.thread_join_timeout)
 
         self.stop_flag = threading.Event()
 
         self.thread = _FusionThread(self.event_id, self.run_in_thread, self.stop_flag)
-        self.thread.daemon = True
-
-        self.thread.start()
+        self.thread.start(_get_worker_pool(self.fusion_app))
 
     def on_stop(self):
         """Function is run when the addin stops.
@@ -100,6 +113,8 @@ class Fusion360CustomThread:
         app = adsk.core.Application.get()
         app.unregisterCustomEvent(self.event_id)
         self.stop_flag.set()
+        if self.thread is not None:
+            self.thread.cancel()
 
 
 class _CustomThreadEventHandler(adsk.core.CustomEventHandler):
@@ -126,49 +141,86 @@ class _CustomThreadEventHandler(adsk.core.CustomEventHandler):
             self.receiver_function(event_dict)
 
         except:
-            ui.messageBox('Thread Handler Failed:\n{}'.format(traceback.format_exc()))
+            report_error('Thread Handler Failed')
+
+
+def _get_worker_pool(fusion_app):
+    if fusion_app is not None:
+        return fusion_app.get_worker_pool()
+    return get_default_worker_pool()
 
 
-class _FusionThread(threading.Thread):
+class _FusionThread:
     def __init__(self, event_id, run_in_thread, stop_event, input_data=None):
-        """Starts a new thread and runs the given function in it
+        """Runs the given function in a worker pool
 
         Args:
             event_id: Unique id, can be used by other functions to trigger the event
             run_in_thread: Function to run in new thread
+            stop_event: Set when the function should return
             input_data: Optional parameter to pass extra data to the thread
         """
-        threading.Thread.__init__(self)
         self.stopped = stop_event
         self.event_id = event_id
         self.run_function = run_in_thread
         self.input_data = input_data
+        self.future = None
+
+    def start(self, pool):
+        """Submits the function to a worker pool
+
+        Args:
+            pool: A :class:`WorkerPool`
+        """
+        self.future = pool.submit(self.run)
 
     def run(self):
-        """Method overwritten on parent class that will be executed when the thread executes
+        """Runs the function, called in a worker thread
         """
         self.run_function(self, self.event_id, self.input_data)
 
+    def is_alive(self):
+        """Whether the function is queued or running"""
+        return self.future is not None and not self.future.done()
+
+    def join(self, timeout=None):
+        """Waits for the function to return
+
+        Args:
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            True if the function returned or never started
+        """
+        if self.future is None:
+            return True
+        return len(wait([self.future], timeout).not_done) == 0
+
+    def cancel(self):
+        """Removes the function from the queue if it has not started yet"""
+        if self.future is not None:
+            self.future.cancel()
+
 
 class Fusion360NewThread:
-    """Starts a new thread and runs the given function in it
+    """Runs the given function in a worker thread
 
     Args:
         event_id: Unique id, can be used by other functions to trigger the event
         input_data: Optional parameter to pass extra data to the thread
+        fusion_app: The FusionApp whose worker pool runs the function, by default a pool shared by the module
     """
-    def __init__(self, event_id, input_data=None):
+    def __init__(self, event_id, input_data=None, fusion_app=None):
         self.event_id = event_id
         self.thread = None
-        self.fusion_app = None
+        self.fusion_app = fusion_app
         self.input_data = input_data
 
         try:
             # create and start the new thread
             self.stop_flag = threading.Event()
             self.thread = _FusionThread(self.event_id, self.run_in_thread, self.stop_flag, self.input_data)
-            self.thread.daemon = True
-            self.thread.start()
+            self.thread.start(_get_worker_pool(self.fusion_app))
 
         except Exception as e:
             app = adsk.core.Application.get()
@@ -191,6 +243,7 @@ class Fusion360NewThread:
         Clean up.  If overridden ensure to execute with super().on_stop()
         """
         self.stop_flag.set()
+        self.thread.cancel()
 
 
 class Fusion360CustomEvent:
@@ -213,7 +266,7 @@ class Fusion360CustomEvent:
             custom_event = app.registerCustomEvent(event_id)
             on_custom_event = _CustomThreadEventHandler(self.custom_event_received)
             custom_event.add(on_custom_event)
-            handlers.append(on_custom_event)
+            self.custom_event_handler = on_custom_event
 
         except Exception as e:
             ui.messageBox('Failed creating custom event:\n{}'.format(traceback.format_exc()))
@@ -249,7 +302,6 @@ class Fusion360DocumentEvent:
         self.event_type = event_type
         self.document_handler = _DocumentHandler(self.document_event_received)
         event_type.add(self.document_handler)
-        handlers.append(self.document_handler)
 
     def document_event_received(self, event_args, document):
         """
@@ -279,7 +331,6 @@ class Fusion360WorkspaceEvent:
         self.event_type = event_type
         self.workspace_handler = _WorkspaceHandler(self.workspace_event_received)
         event_type.add(self.workspace_handler)
-        handlers.append(self.workspace_handler)
 
     def workspace_event_received(self, event_args, workspace):
         """
@@ -315,9 +366,7 @@ class _DocumentHandler(adsk.core.DocumentEventHandler):
             self.document_function(event_args, document)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+            report_error('Document event failed')
 
 
 class _WorkspaceHandler(adsk.core.WorkspaceEventHandler):
@@ -337,9 +386,7 @@ class _WorkspaceHandler(adsk.core.WorkspaceEventHandler):
             self.workspace_function(event_args, workspace)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+            report_error('Workspace event failed')
 
 
 # Event handler for the workspaceActivated event.
@@ -377,9 +424,7 @@ class _WebRequestHandler(adsk.core.WebRequestEventHandler):
             self.web_request_function(event_args, file, fusion_id, occurrence_or_document, private_info, properties)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed to load data in event handler:\n{}'.format(traceback.format_exc()))
+            report_error('Failed to load data in event handler')
 
 
 class Fusion360WebRequestEvent:
@@ -396,7 +441,6 @@ class Fusion360WebRequestEvent:
         self.event_type = event_type
         self.web_request_handler = _WebRequestHandler(self.web_request_event_received)
         event_type.add(self.web_request_handler)
-        handlers.append(self.web_request_handler)
 
     def web_request_event_received(self, event_args, file, fusion_id, occurrence_or_document, private_info, properties):
         """This function will be executed in response to the command event
@@ -437,9 +481,7 @@ class _CommandEventHandler(adsk.core.ApplicationCommandEventHandler):
             self.command_function(event_args, command_id, command_definition)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed to handle Command Event:\n{}'.format(traceback.format_exc()))
+            report_error('Failed to handle Command Event')
 
 
 class Fusion360CommandEvent:
@@ -455,7 +497,6 @@ class Fusion360CommandEvent:
         self.event_type = event_type
         self.command_handler = _CommandEventHandler(self.command_event_received)
         event_type.add(self.command_handler)
-        handlers.append(self.command_handler)
 
     def command_event_received(self, event_args, command_id, command_definition):
         """This function will be executed in response to the command event
@@ -492,9 +533,7 @@ class _ActiveSelectionEventHandler(adsk.core.ActiveSelectionEventHandler):
             self.command_function(event_args, current_selection)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed to handle Selection Event:\n{}'.format(traceback.format_exc()))
+            report_error('Failed to handle Selection Event')
 
 
 class Fusion360ActiveSelectionEvent:
@@ -512,7 +551,6 @@ class Fusion360ActiveSelectionEvent:
         self.command_handler = _ActiveSelectionEventHandler(self.selection_event_received)
         self.event_type = event_type
         self.event_type.add(self.command_handler)
-        handlers.append(self.command_handler)
 
     def selection_event_received(self, event_args, current_selection):
         """This function will be executed in response to the command event
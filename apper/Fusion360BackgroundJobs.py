@@ -0,0 +1,254 @@
+"""
+Fusion360BackgroundJobs.py
+==========================
+Python module for running the computation of a command in a worker thread
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import itertools
+import json
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+import adsk.core
+
+from typing import Any, Optional
+
+from .Fusion360ErrorSink import get_error_sink, report_error
+
+
+class BackgroundJob:
+    """A computation started from a command that runs in a worker thread
+
+    The compute step receives the job and should call :meth:`report_progress` and check :attr:`cancelled`
+    regularly.  The job is passed again to the apply step and to on_job_progress on the main thread.
+
+    Args:
+        job_id: Unique id of the job
+        command: The command that started the job
+        data: The plain data gathered on the main thread
+    """
+
+    # Minimum seconds between two progress notifications to the main thread
+    progress_interval = 0.1
+
+    def __init__(self, job_id: int, command: Any, data: Any):
+        self.job_id = job_id
+        self.command = command
+        self.data = data
+        self.state = 'pending'
+        self.progress = 0.0
+        self.message = ''
+        self.result = None
+        self.error: Optional[str] = None
+        self.exc_info: Optional[tuple] = None
+        self.future = None
+        self.runner: Optional['BackgroundJobRunner'] = None
+        self._cancel_event = threading.Event()
+        self._done_event = threading.Event()
+        self._last_progress_time = 0.0
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job was cancelled, compute should return as soon as possible once this is True"""
+        return self._cancel_event.is_set()
+
+    @property
+    def done(self) -> bool:
+        """Whether the job finished, failed or was cancelled and the main thread has handled it"""
+        return self._done_event.is_set()
+
+    def cancel(self):
+        """Requests the job to stop, apply will not be called"""
+        self._cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            # The job never started, so the worker will not report it as finished
+            self.state = 'cancelled'
+            if self.runner is not None:
+                self.runner.fire(self, 'finished')
+
+    def report_progress(self, progress: float, message: str = ''):
+        """Reports the progress of the computation, call this from compute
+
+        The command's on_job_progress is called on the main thread, at most every progress_interval seconds.
+
+        Args:
+            progress: Fraction of the work done, between 0 and 1
+            message: Optional description of the current step
+        """
+        self.progress = progress
+        self.message = message
+
+        now = time.perf_counter()
+        if now - self._last_progress_time >= self.progress_interval:
+            self._last_progress_time = now
+            if self.runner is not None:
+                self.runner.fire(self, 'progress')
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the main thread has handled the job
+
+        Args:
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            True if the job is done
+        """
+        return self._done_event.wait(timeout)
+
+
+class _BackgroundJobEventHandler(adsk.core.CustomEventHandler):
+    def __init__(self, runner: 'BackgroundJobRunner'):
+        super().__init__()
+        self.runner = runner
+
+    def notify(self, args):
+        """Method overwritten on parent class that will be executed when the event fires
+
+        Args:
+            args: event arguments
+        """
+        app = adsk.core.Application.get()
+        ui = adsk.core.UserInterface.cast(app.userInterface)
+
+        try:
+            event_dict = json.loads(args.additionalInfo)
+            job = self.runner.jobs.get(event_dict['job_id'], None)
+            if job is None:
+                return
+
+            if event_dict['kind'] == 'progress':
+                if job.state == 'running':
+                    job.command.on_job_progress(job)
+                return
+
+            self.runner.jobs.pop(job.job_id, None)
+            try:
+                if job.state == 'finished' and not job.cancelled:
+                    # Make sure a command isn't running before changes are made.
+                    if ui.activeCommand != 'SelectCommand':
+                        ui.commandDefinitions.itemById('SelectCommand').execute()
+
+                    job.command.apply(job.result, job)
+
+                elif job.state == 'failed':
+                    # The traceback of the worker thread is reported, not the one of this handler
+                    get_error_sink().report('Background job of {} failed'.format(job.command.cmd_name), job.exc_info)
+            finally:
+                job._done_event.set()
+
+        except:
+            report_error('Background Job Handler Failed')
+
+
+class BackgroundJobRunner:
+    """Runs the compute step of commands in worker threads and marshals the results back to the main thread
+
+    A single custom event is registered the first time a job is started.
+    Worker threads fire it when a job reports progress or finishes, and its handler runs on the main thread.
+
+    Args:
+        event_id: Unique id of the custom event
+        max_workers: Maximum number of worker threads
+        executor: An existing executor to use instead of creating a thread pool
+    """
+
+    def __init__(self, event_id: str, max_workers: Optional[int] = None, executor: Optional[Executor] = None):
+        self.event_id = event_id
+        self.max_workers = max_workers
+        self.jobs = {}
+        self.handler = None
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._job_ids = itertools.count(1)
+
+    @property
+    def executor(self) -> Executor:
+        """The executor that runs compute, created the first time it is needed"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.event_id)
+        return self._executor
+
+    def _register_event(self):
+        if self.handler is not None:
+            return
+
+        app = adsk.core.Application.get()
+        app.unregisterCustomEvent(self.event_id)
+        custom_event = app.registerCustomEvent(self.event_id)
+        self.handler = _BackgroundJobEventHandler(self)
+        custom_event.add(self.handler)
+
+    def start(self, command: Any, data: Any) -> BackgroundJob:
+        """Starts the compute step of a command in a worker thread
+
+        Args:
+            command: The command, its compute method is called with (data, job)
+            data: The plain data gathered on the main thread
+
+        Returns:
+            The started job
+        """
+        self._register_event()
+
+        job = BackgroundJob(next(self._job_ids), command, data)
+        job.runner = self
+        self.jobs[job.job_id] = job
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def _run(self, job: BackgroundJob):
+        if job.cancelled:
+            job.state = 'cancelled'
+        else:
+            job.state = 'running'
+            try:
+                job.result = job.command.compute(job.data, job)
+                job.state = 'cancelled' if job.cancelled else 'finished'
+            except:
+                job.error = traceback.format_exc()
+                job.exc_info = sys.exc_info()
+                job.state = 'failed'
+
+        self.fire(job, 'finished')
+
+    def fire(self, job: BackgroundJob, kind: str):
+        """Notifies the main thread about a job, safe to call from any thread
+
+        Args:
+            job: The job
+            kind: Either 'progress' or 'finished'
+        """
+        app = adsk.core.Application.get()
+        app.fireCustomEvent(self.event_id, json.dumps({'job_id': job.job_id, 'kind': kind}))
+
+    def cancel_all(self):
+        """Cancels all jobs that have not been handled yet"""
+        for job in list(self.jobs.values()):
+            job.cancel()
+
+    def get_handler_count(self) -> int:
+        """Returns 1 once the custom event handler is registered"""
+        return 0 if self.handler is None else 1
+
+    def stop(self):
+        """Cancels all jobs, unregisters the custom event and shuts down the worker threads
+
+        Running compute steps are not interrupted, their results are discarded.
+        """
+        self.cancel_all()
+        self.jobs = {}
+
+        if self.handler is not None:
+            app = adsk.core.Application.get()
+            app.unregisterCustomEvent(self.event_id)
+            self.handler = None
+
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
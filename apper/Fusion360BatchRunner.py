@@ -0,0 +1,189 @@
+"""
+Fusion360BatchRunner.py
+=======================
+Python module for running a command once for every row of a CSV or JSONL file
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import csv
+import json
+import logging
+import os
+import time
+import traceback
+
+from typing import Any, Iterator, Optional
+
+from .Fusion360Utilities import AppObjects
+
+
+def convert_csv_value(text: str) -> Any:
+    """Converts a CSV cell to a number, boolean, null or list if it is valid JSON, otherwise keeps the text
+
+    Args:
+        text: The cell text
+
+    Returns:
+        The converted value
+    """
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def read_batch_rows(file_name: str, convert_values: bool = True) -> Iterator[dict]:
+    """Reads the parameter sets of a batch one at a time
+
+    Files ending in .csv are read with a header row, anything else is read as JSON lines (one object per line).
+    A line that is not a JSON object raises a ValueError.
+
+    Args:
+        file_name: full path to the input file
+        convert_values: Whether CSV cells are converted with :func:`convert_csv_value`
+
+    Returns:
+        A generator of dictionaries, the input values of each row
+    """
+    for raw_row in _read_raw_rows(file_name):
+        yield _parse_row(raw_row, convert_values)
+
+
+def _read_raw_rows(file_name: str) -> Iterator[Any]:
+    # CSV rows are read as dictionaries of text, JSON lines are left unparsed so a bad line only fails its row
+    if os.path.splitext(file_name)[1].lower() == '.csv':
+        with open(file_name, newline='') as f:
+            yield from csv.DictReader(f)
+    else:
+        with open(file_name) as f:
+            for line in f:
+                if line.strip():
+                    yield line
+
+
+def _parse_row(raw_row: Any, convert_values: bool) -> dict:
+    if isinstance(raw_row, dict):
+        if convert_values:
+            return {key: convert_csv_value(value) for key, value in raw_row.items()}
+        return raw_row
+
+    row = json.loads(raw_row)
+    if not isinstance(row, dict):
+        raise ValueError("Expected a JSON object, got: {}".format(raw_row.strip()))
+    return row
+
+
+class _BatchOutput:
+    """Writes one record per row and flushes it immediately, as CSV or JSON lines"""
+
+    fields = ['row', 'status', 'time', 'input', 'result', 'error']
+
+    def __init__(self, file_name: str):
+        self.file = open(file_name, 'w', newline='')
+        self.writer = None
+        if os.path.splitext(file_name)[1].lower() == '.csv':
+            self.writer = csv.DictWriter(self.file, self.fields)
+            self.writer.writeheader()
+
+    def write(self, record: dict):
+        if self.writer is not None:
+            self.writer.writerow({
+                key: value if isinstance(value, (str, int, float)) or value is None else json.dumps(value, default=str)
+                for key, value in record.items()
+            })
+        else:
+            self.file.write(json.dumps(record, default=str) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BatchRunner:
+    """Runs a command headless for every row of a CSV or JSONL file
+
+    Rows are streamed from the input file and each result is written to the output file as soon as it is available,
+    so memory use does not depend on the size of the batch.
+    The model changes of each row are grouped into a single timeline group.
+    A row that fails, including a line that is not a JSON object, is logged and recorded in the output,
+    the batch then continues with the next row.
+
+    Args:
+        fusion_app: The FusionApp the command belongs to
+        base_cmd_id: this is the value set in options for cmd_id
+        group_rows: Whether the changes of each row are grouped in the timeline, ignored for designs without one
+    """
+
+    def __init__(self, fusion_app: Any, base_cmd_id: str, group_rows: bool = True):
+        self.fusion_app = fusion_app
+        self.base_cmd_id = base_cmd_id
+        self.group_rows = group_rows
+        if fusion_app.logging_enabled:
+            self.logger = fusion_app.logger
+        else:
+            self.logger = logging.getLogger('apper')
+
+    def run_row(self, input_values: dict) -> dict:
+        """Runs the command for a single parameter set
+
+        Args:
+            input_values: The value of each input keyed by input id
+
+        Returns:
+            A dictionary with the "result" returned by on_execute and the execution "time" in seconds
+        """
+        # Direct modeling designs and other products have no timeline to group in
+        time_line = AppObjects().time_line if self.group_rows else None
+        start_index: Optional[int] = None
+        if time_line is not None:
+            start_index = time_line.markerPosition
+        try:
+            return self.fusion_app.execute_command(self.base_cmd_id, input_values)
+        finally:
+            # The group is added to the timeline the row started in, even if the row activated another document
+            if start_index is not None:
+                end_index = time_line.markerPosition - 1
+                if end_index - start_index > 0:
+                    time_line.timelineGroups.add(start_index, end_index)
+
+    def run(self, input_file_name: str, output_file_name: str, convert_values: bool = True) -> dict:
+        """Runs the command for every row of the input file
+
+        Args:
+            input_file_name: full path to a .csv file with a header row or a JSON lines file
+            output_file_name: full path to the results file, written as CSV if it ends in .csv, otherwise JSON lines
+            convert_values: Whether CSV cells are converted with :func:`convert_csv_value`
+
+        Returns:
+            A dictionary with the number of "rows", "succeeded" and "failed" rows and the total "time" in seconds
+        """
+        summary = {'rows': 0, 'succeeded': 0, 'failed': 0, 'time': 0.0}
+        start_time = time.perf_counter()
+
+        output = _BatchOutput(output_file_name)
+        try:
+            for row_number, raw_row in enumerate(_read_raw_rows(input_file_name), 1):
+                record = {'row': row_number, 'input': raw_row.strip() if isinstance(raw_row, str) else raw_row}
+                row_start_time = time.perf_counter()
+                try:
+                    input_values = _parse_row(raw_row, convert_values)
+                    record['input'] = input_values
+                    execution = self.run_row(input_values)
+                    record.update(status='succeeded', result=execution['result'], error=None)
+                    summary['succeeded'] += 1
+                except:
+                    error = traceback.format_exc()
+                    self.logger.error("Batch row {} of {} failed:\n{}".format(row_number, self.base_cmd_id, error))
+                    record.update(status='failed', result=None, error=error)
+                    summary['failed'] += 1
+
+                record['time'] = time.perf_counter() - row_start_time
+                output.write(record)
+                summary['rows'] += 1
+        finally:
+            output.close()
+
+        summary['time'] = time.perf_counter() - start_time
+        return summary
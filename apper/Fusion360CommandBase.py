@@ -6,6 +6,8 @@ Python module for creating a Fusion 360 Command
 :copyright: (c) 2019 by Patrick Rainsberry.
 :license: Apache 2.0, see LICENSE for more details.
 """
+import importlib
+import time
 import traceback
 
 import adsk.core
@@ -13,8 +15,14 @@ import adsk.fusion
 
 import os.path
 import sys
-from .FusionApp import FusionApp
+from typing import Any, Callable, Optional
 
+from .FusionApp import FusionApp, UILookupCache
+from .Fusion360CommandInputs import InputSchema, InputSnapshot, LazyInputValues, make_input_snapshot
+from .Fusion360Metrics import CommandMetrics, NULL_TIMER
+from .Fusion360ErrorSink import report_error
+
+# Handlers of the command dialog are kept by its command object, see Fusion360CommandBase.get_dialog_handlers
 handlers = []
 create_handlers = []
 
@@ -30,6 +38,13 @@ def _destroy_object(obj_to_be_deleted):
         # ui.messageBox(obj_to_be_deleted.id + 'is not a valid object')
 
 
+def _drop_down_controls(controls, drop_down_cmd_id):
+    drop_control = controls.itemById(drop_down_cmd_id)
+    if not drop_control:
+        return None
+    return drop_control.controls
+
+
 class Fusion360CommandBase:
     """The Fusion360CommandBase class wraps the common tasks used when creating a Fusion 360 Command.
 
@@ -50,7 +65,13 @@ class Fusion360CommandBase:
         self.cmd_description = options.get('cmd_description', 'Default Command Description')
         self.cmd_id = options.get('cmd_id', 'default_cmd_id')
         self.cmd_ctrl_id = options.get('cmd_ctrl_id', self.cmd_id)
-        self.workspace = options.get('workspace', 'FusionSolidEnvironment')
+        workspace = options.get('workspace', 'FusionSolidEnvironment')
+        if isinstance(workspace, str):
+            self.workspaces = [workspace]
+        else:
+            self.workspaces = list(workspace)
+        self.workspace = self.workspaces[0]
+        self.toolbar_tab_per_workspace = options.get('toolbar_tab_per_workspace', False)
         self.toolbar_panel_id = options.get('toolbar_panel_id', 'SolidScriptsAddinsPanel')
         self.toolbar_tab_id = options.get('toolbar_tab_id', 'ToolsTab')
         self.toolbar_tab_name = options.get('toolbar_tab_name', 'ToolsTab')
@@ -72,14 +93,62 @@ class Fusion360CommandBase:
 
         self.debug = options.get('debug')
 
+        self.options = options
+
         self.command = None
         self.command_inputs = None
+        self.input_schema: Optional[InputSchema] = None
+        self._input_layout_may_have_changed = False
         self.args = None
         self.control = None
+        self.controls = []
         self.command_definition = None
+        self.create_handler = None
+        self.dialog_handlers: Optional[list] = None
         self.changed_input = None
+        self.changed_keys = set()
         self.args = None
 
+        self.incremental_inputs = options.get('incremental_inputs', False)
+        self.lazy_inputs = options.get('lazy_inputs', False)
+        self.input_snapshots = options.get('input_snapshots', False)
+        self.input_values_snapshot: Optional[dict] = None
+        self._snapshot_schema: Optional[InputSchema] = None
+        self._preview_changed_keys = set()
+
+        self.skip_unchanged_preview = options.get('skip_unchanged_preview', False)
+        self.preview_unchanged = False
+        self.previews_reused = 0
+        self.last_preview_fingerprint: Optional[tuple] = None
+        self._unfingerprinted_changes = 0
+
+        self.preview_cache: Optional['PreviewCache'] = None
+        preview_cache_size = options.get('preview_cache_size', 0)
+        if self.skip_unchanged_preview and preview_cache_size == 0:
+            # Unchanged previews are rendered again from the data of the last one
+            preview_cache_size = 8
+        if preview_cache_size > 0:
+            from .Fusion360PreviewCache import PreviewCache
+            self.preview_cache = PreviewCache(preview_cache_size, options.get('preview_cache_bytes', None))
+        self.preview_fingerprint: Optional[tuple] = None
+
+        validate_inputs_depend_on = options.get('validate_inputs_depend_on', None)
+        self.validate_inputs_depend_on: Optional[set] = None
+        if validate_inputs_depend_on is not None:
+            self.validate_inputs_depend_on = set(validate_inputs_depend_on)
+        self.validations_avoided = 0
+        self.validation_dirty = True
+        self._last_validation_result = True
+
+        self.execute_in_background = options.get('execute_in_background', False)
+        self.headless = False
+        self.last_execution_time: Optional[float] = None
+        self.last_job = None
+
+        self.metrics: Optional[CommandMetrics] = None
+        if self.fusion_app is not None and self.fusion_app.metrics_enabled:
+            self.metrics = CommandMetrics()
+
         drop_down_folder = options.get('drop_down_resources', 'demo_icons')
         resources_folder = options.get('cmd_resources', 'demo_icons')
         #
@@ -107,6 +176,15 @@ class Fusion360CommandBase:
         Code in this function will cause the graphics to refresh.
         Note if your addin is complex it may be useful to only preview a subset of the full operations
 
+        self.changed_keys contains the ids of the inputs that changed since the last preview.
+
+        Fusion discards the previous preview before each executePreview, so this method is called even when
+        the input values didn't change, i.e. on re-activation or re-validation.
+        If options['skip_unchanged_preview'] is True, self.preview_unchanged tells whether the input values are
+        the same as in the last preview, and get_preview_data returns the data computed for that preview,
+        so only the cheap step of showing that data again is left.  A preview cache is created for this if
+        preview_cache_size isn't set.  Any change to an input that can't be fingerprinted (i.e. a table or an
+        input inside a group) counts as a change.  Unchanged previews are counted in self.previews_reused.
 
         Args:
             input_values: Opinionated dictionary of the useful values a user entered.  The key is the command_id.
@@ -165,6 +243,8 @@ class Fusion360CommandBase:
         When a user changes anything in the command dialog this method is executed.
         Typically used for making changes to the command dialog itself.
 
+        self.changed_keys contains the id of the changed input.
+
         Args:
             command: reference to the command object
             inputs: quick reference directly to the commandInputs object
@@ -177,6 +257,8 @@ class Fusion360CommandBase:
                    args: adsk.core.CommandEventArgs, input_values: dict):
         """Will be executed when user selects OK in command dialog.
 
+        If options['execute_in_background'] is True gather, compute and apply are called instead,
+        so that long computations do not block Fusion 360.  See :meth:`gather`.
 
         Args:
             command: reference to the command object
@@ -186,6 +268,105 @@ class Fusion360CommandBase:
         """
         pass
 
+    def execute_headless(self, input_values: dict) -> Any:
+        """Runs on_execute with the given input values, without showing the command dialog
+
+        No dialog is created and the create, preview, validate and input changed events are skipped.
+        on_execute is called with None for command, inputs and args and self.headless is True during the call,
+        so it must only use input_values.  The time of each call is stored in self.last_execution_time.
+
+        If options['execute_in_background'] is True, gather, compute and apply run one after the other
+        on the calling thread instead, compute receives a :class:`BackgroundJob` that is never cancelled.
+        If options['input_snapshots'] is True the values are passed as a snapshot, see make_input_snapshot.
+
+        Args:
+            input_values: The value of each input keyed by input id, as on_execute would receive them
+
+        Returns:
+            The return value of on_execute, or of compute in background mode
+        """
+        if self.input_snapshots:
+            input_values = make_input_snapshot(input_values)
+        else:
+            input_values = dict(input_values)
+
+        start_time = time.perf_counter()
+        self.headless = True
+        try:
+            if self.execute_in_background:
+                return self._execute_job_now(input_values)
+            return self.on_execute(None, None, None, input_values)
+        finally:
+            self.headless = False
+            self.last_execution_time = time.perf_counter() - start_time
+            if self.metrics is not None:
+                self.metrics.get_histogram('headless_execute', 'callback').record(self.last_execution_time)
+
+    def _execute_job_now(self, input_values) -> Any:
+        from .Fusion360BackgroundJobs import BackgroundJob
+
+        job = BackgroundJob(0, self, self.gather(None, None, None, input_values))
+        job.state = 'running'
+        job.result = self.compute(job.data, job)
+        job.state = 'finished'
+        self.apply(job.result, job)
+        job._done_event.set()
+        return job.result
+
+    def gather(self, command: adsk.core.Command, inputs: adsk.core.CommandInputs,
+               args: adsk.core.CommandEventArgs, input_values: dict) -> Any:
+        """Used instead of on_execute if options['execute_in_background'] is True, runs on the main thread.
+
+        Collect everything compute needs from the inputs and the model as plain python data.
+        The default returns the input values as a dictionary without the '_input' entries.
+
+        Args:
+            command: reference to the command object
+            inputs: quick reference directly to the commandInputs object
+            args: All of the args associated with the CommandEvent
+            input_values: Opinionated dictionary of the useful values a user entered.  The key is the command_id.
+
+        Returns:
+            The data that is passed to compute
+        """
+        if isinstance(input_values, InputSnapshot):
+            return input_values._asdict()
+        return {key: value for key, value in input_values.items() if not key.endswith('_input')}
+
+    def compute(self, data: Any, job) -> Any:
+        """Runs in a worker thread with the data returned by gather, if options['execute_in_background'] is True.
+
+        Do not use the Fusion 360 API here.  Call job.report_progress regularly and return early if job.cancelled.
+        CPU heavy work can in turn be sent to a process pool from here.
+
+        Args:
+            data: The data returned by gather
+            job: The :class:`BackgroundJob`
+
+        Returns:
+            The result that is passed to apply
+        """
+        return data
+
+    def apply(self, result: Any, job):
+        """Runs on the main thread with the result of compute, make the changes to the model here
+
+        Not called if the job was cancelled or compute failed.
+
+        Args:
+            result: The result returned by compute
+            job: The :class:`BackgroundJob`
+        """
+        pass
+
+    def on_job_progress(self, job):
+        """Runs on the main thread when a background job reports progress
+
+        Args:
+            job: The :class:`BackgroundJob`, see job.progress and job.message
+        """
+        pass
+
     def validate_inputs(self, command: adsk.core.Command, inputs: adsk.core.CommandInputs,
                         args: adsk.core.ValidateInputsEventArgs, input_values: dict) -> bool:
         """Function to validate the current state of the inputs.
@@ -193,6 +374,11 @@ class Fusion360CommandBase:
         This function should return a boolean.  If it returns True (or nothing), the current state of the inputs is
         assumed to be valid.  This means that previews will be calculated, and the OK button will be enabled.
 
+        Set options['validate_inputs_depend_on'] to the list of input ids your validation reads to avoid
+        calling this function on every validateInputs event.
+        The last result is then reused until one of those inputs changes or the command is re-activated.
+        The number of reused results is counted in self.validations_avoided.
+
         Args:
             command: reference to the command object
             inputs: quick reference directly to the commandInputs object
@@ -221,69 +407,288 @@ class Fusion360CommandBase:
     def get_inputs(self):
         """Returns a dictionary for all inputs. Very useful for creating quick Fusion 360 Add-ins
 
+        The inputs are classified once per dialog (see :class:`InputSchema`), each call only reads the current values.
+        """
+        return self.get_input_schema().get_values()
+
+    def get_event_input_values(self, changed_input: Optional[adsk.core.CommandInput] = None,
+                               refresh: bool = False) -> dict:
+        """Returns the input values passed to the command event methods
+
+        If options['incremental_inputs'] is True a snapshot of the input values is kept for the life of the dialog.
+        On an input changed event only the value of the changed input is read again.
+        The snapshot is fully refreshed on activate, execute and destroy.
+        If your code changes input values directly call this method with refresh=True to update the snapshot.
+
+        Note that in this mode the same dictionary is passed to every event, treat it as read only.
+
+        If options['lazy_inputs'] is True a :class:`LazyInputValues` mapping is returned for each event instead.
+        Values are only read from Fusion when their key is first accessed during that event.
+        This takes precedence over incremental_inputs.
+
+        If options['input_snapshots'] is True a new snapshot object, see :meth:`get_input_snapshot`,
+        is returned for each event.  This takes precedence over incremental_inputs.
+
+        Args:
+            changed_input: The input that changed, if any
+            refresh: If True all values are read again
+
+        Returns:
+            The current input values, see get_inputs
+        """
+        if self.lazy_inputs:
+            return LazyInputValues(self.get_input_schema())
+
+        if self.input_snapshots:
+            return self.get_input_snapshot()
+
+        if not self.incremental_inputs:
+            return self.get_inputs()
+
+        schema = self.get_input_schema()
+        if refresh or self.input_values_snapshot is None:
+            self.input_values_snapshot = schema.get_values()
+            self._snapshot_schema = schema
+            return self.input_values_snapshot
+
+        if schema is not self._snapshot_schema:
+            # Inputs were added or removed, only read the new ones
+            schema.update_changed_values(self.input_values_snapshot, self._snapshot_schema)
+            self._snapshot_schema = schema
+
+        if changed_input is not None:
+            # Inputs that are not in the schema (i.e. inside a group) are not part of the input values
+            schema.update_value(self.input_values_snapshot, changed_input.id)
+
+        return self.input_values_snapshot
+
+    def get_input_snapshot(self) -> InputSnapshot:
+        """Returns the current input values as an object with one attribute per input id
+
+        An alternative to get_inputs.  The class of the object has __slots__ for each input
+        and is generated once for the layout of the dialog.
+        Use snapshot._input(input_id) to get the input itself and snapshot._asdict() for a dictionary of values.
+        """
+        return self.get_input_schema().get_snapshot()
+
+    def get_input_schema(self) -> InputSchema:
+        """Returns the classification of the inputs in the current dialog
+
+        The schema is only rebuilt when the inputs of the dialog changed, see :meth:`InputSchema.is_current`.
+        The last input is only compared after on_create, on_activate and on_input_changed,
+        where inputs are usually added or removed, other events only compare the number of inputs.
+        """
+        schema = self.input_schema
+        if schema is None or not schema.is_current(self.command_inputs, self._input_layout_may_have_changed):
+            self.input_schema = InputSchema(self.command_inputs)
+        self._input_layout_may_have_changed = False
+        return self.input_schema
+
+    def invalidate_input_schema(self):
+        """Rebuilds the input schema the next time it is needed
+
+        Call this if your code replaces inputs outside of on_create, on_activate and on_input_changed.
+        """
+        self.input_schema = None
+
+    def _input_callback_finished(self):
+        # The callback may have added or removed inputs, check the layout the next time the schema is used
+        self._input_layout_may_have_changed = True
+
+    def get_input_fingerprint(self) -> tuple:
+        """Returns a hashable fingerprint of the current input values, see :meth:`InputSchema.get_fingerprint`
+
+        The fingerprint also counts the changes of inputs that can't be fingerprinted,
+        so such a change never matches an earlier fingerprint.
+        """
+        return self._unfingerprinted_changes, self.get_input_schema().get_fingerprint()
+
+    def get_preview_data(self, compute: Callable[[], Any], size: Optional[int] = None, key: Any = None) -> Any:
+        """Returns data derived from the current input values, computing it only if it is not cached
+
+        Use this in on_preview for expensive intermediate results such as point arrays or temporary BRep bodies.
+        If options['preview_cache_size'] is set, results are kept in self.preview_cache keyed by the input
+        fingerprint and key, so going back to previous input values reuses their result.
+        Give each call in the same on_preview a different key, otherwise they share one result.
+        Set options['preview_cache_bytes'] to also limit the approximate size of the cache.
+        The cache is cleared when the command is destroyed.
+
+        Args:
+            compute: Function with no arguments that computes the data
+            size: Size of the data in bytes, if None it is estimated
+            key: Hashable name of the data, i.e. 'points'
+
+        Returns:
+            The cached or newly computed data
+        """
+        if self.preview_cache is None:
+            return compute()
+
+        fingerprint = self.preview_fingerprint
+        if fingerprint is None:
+            fingerprint = self.get_input_fingerprint()
+        return self.preview_cache.get_or_compute((key, fingerprint), compute, size)
+
+    def start_event_timer(self, event_name: str):
+        """Starts measuring the latency of a command event, does nothing unless metrics are enabled
+
+        See :meth:`FusionApp.enable_metrics`
+
+        Args:
+            event_name: Name of the event, i.e. 'preview'
+        """
+        if self.metrics is None:
+            return NULL_TIMER
+        return self.metrics.start_timer(event_name)
+
+    def set_metrics_enabled(self, enabled: bool):
+        """Starts or stops recording the latency of the events of this command
+
+        Args:
+            enabled: If False the recorded metrics are discarded
+        """
+        if not enabled:
+            self.metrics = None
+        elif self.metrics is None:
+            self.metrics = CommandMetrics()
+
+    def get_metrics(self) -> Optional[dict]:
+        """Returns the latency of the events of this command, see :meth:`CommandMetrics.get_summary`
+
+        Returns:
+            The metrics summary, or None if metrics are not enabled
         """
-        value_types = [adsk.core.BoolValueCommandInput.classType(), adsk.core.DistanceValueCommandInput.classType(),
-                       adsk.core.FloatSpinnerCommandInput.classType(),
-                       adsk.core.IntegerSpinnerCommandInput.classType(),
-                       adsk.core.ValueCommandInput.classType(),
-                       adsk.core.StringValueCommandInput.classType()]
-
-        slider_types = [adsk.core.FloatSliderCommandInput.classType(),
-                        adsk.core.IntegerSliderCommandInput.classType()]
-
-        list_types = [adsk.core.ButtonRowCommandInput.classType(), adsk.core.DropDownCommandInput.classType(),
-                      adsk.core.RadioButtonGroupCommandInput.classType()]
-
-        selection_types = [adsk.core.SelectionCommandInput.classType()]
-
-        input_values = {}
-        input_values.clear()
-
-        for command_input in [self.command_inputs.item(i) for i in range(0, self.command_inputs.count)]:
-
-            # If the input type is in this list the value of the input is returned
-            if command_input.objectType in value_types:
-                input_values[command_input.id] = command_input.value
-                input_values[command_input.id + '_input'] = command_input
-
-            elif command_input.objectType in slider_types:
-                input_values[command_input.id] = command_input.valueOne
-                input_values[command_input.id + '_input'] = command_input
-
-            # TODO need to account for radio and button multi select also
-            # If the input type is in this list the name of the selected list item is returned
-            elif command_input.objectType in list_types:
-                if command_input.objectType == adsk.core.DropDownCommandInput.classType():
-                    if command_input.dropDownStyle == adsk.core.DropDownStyles.CheckBoxDropDownStyle:
-                        input_values[command_input.id] = command_input.listItems
-                        input_values[command_input.id + '_input'] = command_input
-
-                    else:
-                        if command_input.selectedItem is not None:
-                            input_values[command_input.id] = command_input.selectedItem.name
-                            input_values[command_input.id + '_input'] = command_input
-                else:
-                    if command_input.selectedItem is not None:
-                        input_values[command_input.id] = command_input.selectedItem.name
-                    else:
-                        input_values[command_input.id] = None
-                    input_values[command_input.id + '_input'] = command_input
-
-            # If the input type is a selection an array of entities is returned
-            elif command_input.objectType in selection_types:
-                selections = []
-                if command_input.selectionCount > 0:
-                    for i in range(0, command_input.selectionCount):
-                        selections.append(command_input.selection(i).entity)
-
-                input_values[command_input.id] = selections
-                input_values[command_input.id + '_input'] = command_input
+        if self.metrics is None:
+            return None
+        return self.metrics.get_summary()
+
+    def get_handler_count(self) -> int:
+        """Returns the number of event handlers this command currently keeps alive
 
+        The same dialog handlers are reused every time the dialog opens, so this does not grow as the command is used.
+        """
+        count = 0
+        if self.dialog_handlers is not None:
+            count += len(self.dialog_handlers)
+        if self.create_handler is not None:
+            count += 1
+        return count
+
+    def _create_dialog_handlers(self) -> list:
+        return [
+            ('execute', _CommandExecuteHandler(self)),
+            ('inputChanged', _InputChangedHandler(self)),
+            ('destroy', _DestroyHandler(self)),
+            ('executePreview', _PreviewHandler(self)),
+            ('activate', _ActivateHandler(self)),
+            ('mouseDragEnd', _MouseDragEndHandler(self)),
+            ('validateInputs', _CommandValidateInputsHandler(self)),
+        ]
+
+    def get_dialog_handlers(self) -> list:
+        """Returns the handlers that are connected to the events of the command dialog
+
+        The handlers only reference this command object, so they are created once
+        and connected again to the new Command every time the dialog opens.
+
+        Returns:
+            A list of (event name, handler) tuples
+        """
+        if self.dialog_handlers is None:
+            self.dialog_handlers = self._create_dialog_handlers()
+        return self.dialog_handlers
+
+    def _get_placements(self) -> list:
+        if self.command_in_nav_bar or self.command_in_qat_bar or len(self.workspaces) == 1:
+            return [(self.workspace, self.toolbar_tab_id, self.cmd_ctrl_id)]
+
+        placements = []
+        for workspace in self.workspaces:
+            if self.toolbar_tab_per_workspace:
+                toolbar_tab_id = self.toolbar_tab_id + '_' + workspace
             else:
-                input_values[command_input.id] = command_input.name
-                input_values[command_input.id + '_input'] = command_input
+                toolbar_tab_id = self.toolbar_tab_id
+            placements.append((workspace, toolbar_tab_id, self.cmd_ctrl_id + '_' + workspace))
+        return placements
+
+    def _get_controls(self, ui: adsk.core.UserInterface, ui_cache: UILookupCache, workspace: str, toolbar_tab_id: str):
+        if self.command_in_nav_bar:
+            controls_key = ('NavToolbar',)
+            controls = ui_cache.get(controls_key, 3, lambda: ui.toolbars.itemById('NavToolbar').controls)
+        elif self.command_in_qat_bar:
+            controls_key = ('QAT',)
+            controls = ui_cache.get(controls_key, 3, lambda: ui.toolbars.itemById('QAT').controls)
+        else:
+            workspace_key = ('workspace', workspace)
+            this_workspace = ui_cache.get(workspace_key, 2, lambda: ui.workspaces.itemById(workspace))
+            if this_workspace is None:
+                ui.messageBox(workspace + ' is not a valid workspace')
+                raise ValueError
+
+            # Add to existing Toolbar Tab or create a new one
+            tab_key = workspace_key + ('toolbar_tab', toolbar_tab_id)
+            toolbar_tab = ui_cache.get(tab_key, 2, lambda: this_workspace.toolbarTabs.itemById(toolbar_tab_id))
+            if toolbar_tab is None:
+                toolbar_tab = this_workspace.toolbarTabs.add(toolbar_tab_id, self.toolbar_tab_name)
+                toolbar_tab.activate()
+                self.fusion_app.tabs.append(toolbar_tab)
+                ui_cache.set(tab_key, toolbar_tab)
+
+            # Add to existing Toolbar Panel or create a new one
+            panel_key = tab_key + ('toolbar_panel', self.toolbar_panel_id)
+            toolbar_panel = ui_cache.get(
+                panel_key, 2, lambda: toolbar_tab.toolbarPanels.itemById(self.toolbar_panel_id)
+            )
+            if toolbar_panel is None:
+                toolbar_panel = toolbar_tab.toolbarPanels.add(self.toolbar_panel_id, self.toolbar_panel_id)
+                ui_cache.set(panel_key, toolbar_panel)
+
+            # Controls for the defined panel
+            controls_key = panel_key + ('controls',)
+            controls = ui_cache.get(controls_key, 1, lambda: toolbar_panel.controls)
+
+        # If adding to drop down, find or create dropdown in parent
+        if self.add_to_drop_down:
+            drop_down_key = controls_key + ('drop_down', self.drop_down_cmd_id)
+            drop_controls = ui_cache.get(
+                drop_down_key, 2, lambda: _drop_down_controls(controls, self.drop_down_cmd_id)
+            )
+            if drop_controls is None:
+                drop_control = controls.addDropDown(
+                    self.drop_down_name,
+                    self.drop_down_resources,
+                    self.drop_down_cmd_id)
+                drop_controls = drop_control.controls
+                ui_cache.set(drop_down_key, drop_controls)
+            controls = drop_controls
+
+        return controls
+
+    def replace_command(self, old_command: 'Fusion360CommandBase'):
+        """Takes over the command definition and controls of a previous instance of this command
+
+        The commandCreated handler of the old instance is swapped for one of this instance.
+        Used to reload a command without recreating any of its user interface.
+
+        Args:
+            old_command: The command object being replaced
+        """
+        self.command_definition = old_command.command_definition
+        self.control = old_command.control
+        self.controls = old_command.controls
+
+        if self.command_definition is None:
+            return
 
-        return input_values
+        old_handler = old_command.create_handler
+        if old_handler is not None:
+            self.command_definition.commandCreated.remove(old_handler)
+            if old_handler in create_handlers:
+                create_handlers.remove(old_handler)
+
+        self.create_handler = self._get_create_event()
+        self.command_definition.commandCreated.add(self.create_handler)
+        create_handlers.append(self.create_handler)
 
     def on_run(self):
         """Function is run when the addin starts.
@@ -294,49 +699,14 @@ class Fusion360CommandBase:
         ui = app.userInterface
 
         try:
-            if self.command_in_nav_bar:
-                toolbars = ui.toolbars
-                nav_bar = toolbars.itemById('NavToolbar')
-                controls = nav_bar.controls
-            elif self.command_in_qat_bar:
-                toolbars = ui.toolbars
-                qat_bar = toolbars.itemById('QAT')
-                controls = qat_bar.controls
-            else:
-                all_workspaces = ui.workspaces
-                this_workspace = all_workspaces.itemById(self.workspace)
-                if this_workspace is None:
-                    ui.messageBox(self.workspace + ' is not a valid workspace')
-                    raise ValueError
-
-                # Add to existing Toolbar Tab or create a new one
-                all_toolbar_tabs = this_workspace.toolbarTabs
-                toolbar_tab = all_toolbar_tabs.itemById(self.toolbar_tab_id)
-                if toolbar_tab is None:
-                    toolbar_tab = all_toolbar_tabs.add(self.toolbar_tab_id, self.toolbar_tab_name)
-                    toolbar_tab.activate()
-                    self.fusion_app.tabs.append(toolbar_tab)
-
-                # Add to existing Toolbar Panel or create a new one
-                all_toolbar_panels = toolbar_tab.toolbarPanels
-                toolbar_panel = all_toolbar_panels.itemById(self.toolbar_panel_id)
-                if toolbar_panel is None:
-                    toolbar_panel = all_toolbar_panels.add(self.toolbar_panel_id, self.toolbar_panel_id)
-
-                # Controls for the defined panel
-                controls = toolbar_panel.controls
-
-            # If adding to drop down, find or create dropdown in parent
-            if self.add_to_drop_down:
-                drop_control = controls.itemById(self.drop_down_cmd_id)
-                if not drop_control:
-                    drop_control = controls.addDropDown(
-                        self.drop_down_name,
-                        self.drop_down_resources,
-                        self.drop_down_cmd_id)
-                controls = drop_control.controls
-
-            # Create the command definition
+            # Lookups are shared by all commands registered in the same run of the app
+            ui_cache = None
+            if self.fusion_app is not None:
+                ui_cache = self.fusion_app.ui_cache
+            if ui_cache is None:
+                ui_cache = UILookupCache()
+
+            # Create the command definition, shared by the controls in all workspaces
             self.command_definition = ui.commandDefinitions.itemById(self.cmd_id)
             if not self.command_definition:
                 self.command_definition = ui.commandDefinitions.addButtonDefinition(
@@ -348,14 +718,22 @@ class Fusion360CommandBase:
                 on_command_created_handler = self._get_create_event()
                 self.command_definition.commandCreated.add(on_command_created_handler)
                 create_handlers.append(on_command_created_handler)
+                self.create_handler = on_command_created_handler
+
+            # Create the new controls
+            self.controls = []
+            for workspace, toolbar_tab_id, cmd_ctrl_id in self._get_placements():
+                controls = self._get_controls(ui, ui_cache, workspace, toolbar_tab_id)
 
-            # Create the new control
-            self.control = controls.itemById(self.cmd_ctrl_id)
-            if not self.control:
-                self.control = controls.addCommand(self.command_definition)
-                self.control.isVisible = self.command_visible
-                if self.command_promoted:
-                    self.control.isPromoted = self.command_promoted
+                control = controls.itemById(cmd_ctrl_id)
+                if not control:
+                    control = controls.addCommand(self.command_definition)
+                    control.isVisible = self.command_visible
+                    if self.command_promoted:
+                        control.isPromoted = self.command_promoted
+                self.controls.append(control)
+
+            self.control = self.controls[0]
 
             # TODO this is broken for some reason.  No access to ui in the run method?
             # self.command_definition.controlDefinition.isEnabled = self.command_enabled
@@ -376,52 +754,200 @@ class Fusion360CommandBase:
         ui = app.userInterface
 
         try:
-            parent = None
-            try:
-                parent = self.control.parent
-            except:
-                pass
+            controls = self.controls
+            if not controls:
+                controls = [self.control]
+
+            for control in controls:
+                parent = None
+                try:
+                    parent = control.parent
+                except:
+                    pass
+
+                _destroy_object(control)
+
+                if parent is not None:
+                    if parent.objectType == adsk.core.DropDownControl.classType():
+                        if parent.controls.count == 0:
+                            drop_control = parent
+                            parent = drop_control.parent
+                            drop_control.deleteMe()
+
+                    if parent.objectType == adsk.core.ToolbarPanel.classType():
+                        if parent.controls.count == 0:
+                            if parent.isValid:
+                                parent.deleteMe()
 
-            _destroy_object(self.control)
             _destroy_object(self.command_definition)
-
-            if parent is not None:
-                if parent.objectType == adsk.core.DropDownControl.classType():
-                    if parent.controls.count == 0:
-                        drop_control = parent
-                        parent = drop_control.parent
-                        drop_control.deleteMe()
-
-                if parent.objectType == adsk.core.ToolbarPanel.classType():
-                    if parent.controls.count == 0:
-                        if parent.isValid:
-                            parent.deleteMe()
+            self.dialog_handlers = None
 
         except:
             if ui:
                 ui.messageBox('AddIn Stop Failed: {}'.format(traceback.format_exc()))
 
 
+def _import_command_class(class_path: str, package: Optional[str] = None):
+    module_name, _, class_name = class_path.replace(':', '.').rpartition('.')
+    module = importlib.import_module(module_name, package)
+    return getattr(module, class_name)
+
+
+class _LazyCommand(Fusion360CommandBase):
+    """Placeholder that registers the UI for a command without constructing it
+
+    Only the command definition and control are created when the add-in starts.
+    The actual command object is constructed the first time the command is clicked.
+
+    Note that on_run is not called on the actual command, only the base class UI registration is done.
+
+    Args:
+        name: The name of the command
+        options: A dictionary of options for the command
+        command_class: Your subclass of Fusion360CommandBase, or an import path such as 'commands.MyCommand.MyCommand'.
+            A relative import path is resolved against options['command_package'].
+    """
+
+    def __init__(self, name: str, options: dict, command_class: Any):
+        super().__init__(name, options)
+        self.command_class = command_class
+        self.command_object: Optional[Fusion360CommandBase] = None
+        self.materialize_time = None
+
+    def materialize(self) -> Fusion360CommandBase:
+        """Constructs the actual command object, importing its module if necessary
+
+        Returns:
+            The command object
+        """
+        if self.command_object is None:
+            start_time = time.perf_counter()
+
+            command_class = self.command_class
+            if isinstance(command_class, str):
+                command_class = _import_command_class(command_class, self.options.get('command_package', None))
+
+            command_object = command_class(self.cmd_name, self.options)
+            command_object.command_definition = self.command_definition
+            command_object.control = self.control
+            command_object.controls = self.controls
+
+            self.command_object = command_object
+            self.materialize_time = time.perf_counter() - start_time
+
+        return self.command_object
+
+    def reload(self):
+        """Reloads the module of the command class, the command is constructed again the next time it is clicked"""
+        if isinstance(self.command_class, str):
+            module_name = self.command_class.replace(':', '.').rpartition('.')[0]
+            module = importlib.import_module(module_name, self.options.get('command_package', None))
+            importlib.reload(module)
+        else:
+            module = importlib.reload(sys.modules[self.command_class.__module__])
+            self.command_class = getattr(module, self.command_class.__name__)
+
+        self.command_object = None
+        self.materialize_time = None
+
+    def _get_create_event(self):
+        return _LazyCommandCreatedHandler(self)
+
+    def set_metrics_enabled(self, enabled: bool):
+        """Starts or stops recording the latency of the events of the actual command"""
+        super().set_metrics_enabled(enabled)
+        if self.command_object is not None:
+            self.command_object.set_metrics_enabled(enabled)
+
+    def get_metrics(self) -> Optional[dict]:
+        """Returns the metrics of the actual command, if it was constructed"""
+        if self.command_object is not None:
+            return self.command_object.get_metrics()
+        return None
+
+    def get_handler_count(self) -> int:
+        """Returns the number of event handlers of the placeholder and the actual command"""
+        count = super().get_handler_count()
+        if self.command_object is not None:
+            count += self.command_object.get_handler_count()
+        return count
+
+    def on_stop(self):
+        """Stops the actual command if it was constructed, otherwise removes the placeholder UI"""
+        if self.command_object is not None:
+            self.command_object.on_stop()
+        else:
+            super().on_stop()
+
+
+class _LazyCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
+    def __init__(self, lazy_command: _LazyCommand):
+        super().__init__()
+        self.lazy_command = lazy_command
+        self.command_object = None
+        self.create_handler = None
+
+    def notify(self, args):
+        try:
+            # Built on first use and again if the command was reloaded
+            command_object = self.lazy_command.materialize()
+            if command_object is not self.command_object:
+                if self.create_handler in create_handlers:
+                    create_handlers.remove(self.create_handler)
+                self.command_object = command_object
+                self.create_handler = command_object._get_create_event()
+                create_handlers.append(self.create_handler)
+
+            self.create_handler.notify(args)
+
+        except:
+            report_error('Command created failed')
+
+
 class _PreviewHandler(adsk.core.CommandEventHandler):
     def __init__(self, cmd_object):
         super().__init__()
         self.cmd_object_ = cmd_object
 
     def notify(self, args):
-        app = adsk.core.Application.cast(adsk.core.Application.get())
-        ui = app.userInterface
+        timer = self.cmd_object_.start_event_timer('preview')
 
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
             self.cmd_object_.command_inputs = command_inputs
 
-            input_values = self.cmd_object_.get_inputs()
-            self.cmd_object_.on_preview(command_, command_inputs, args, input_values)
+            self.cmd_object_.changed_keys = self.cmd_object_._preview_changed_keys
+            self.cmd_object_._preview_changed_keys = set()
+
+            fingerprint = None
+            if self.cmd_object_.skip_unchanged_preview or self.cmd_object_.preview_cache is not None:
+                fingerprint = self.cmd_object_.get_input_fingerprint()
+
+            if self.cmd_object_.skip_unchanged_preview:
+                # Fusion discarded the last preview, on_preview shows it again from the cached data
+                preview_unchanged = fingerprint == self.cmd_object_.last_preview_fingerprint
+                self.cmd_object_.preview_unchanged = preview_unchanged
+                if preview_unchanged:
+                    self.cmd_object_.previews_reused += 1
+                self.cmd_object_.last_preview_fingerprint = None
+
+            input_values = self.cmd_object_.get_event_input_values()
+            self.cmd_object_.preview_fingerprint = fingerprint
+            try:
+                timer.callback_started()
+                self.cmd_object_.on_preview(command_, command_inputs, args, input_values)
+                timer.callback_finished()
+            finally:
+                self.cmd_object_.preview_fingerprint = None
+
+            if self.cmd_object_.skip_unchanged_preview:
+                self.cmd_object_.last_preview_fingerprint = fingerprint
+
+            timer.stop()
 
         except:
-            if ui:
-                ui.messageBox('Input changed event failed: {}'.format(traceback.format_exc()))
+            report_error('Preview event failed')
 
 
 class _ActivateHandler(adsk.core.CommandEventHandler):
@@ -430,20 +956,25 @@ class _ActivateHandler(adsk.core.CommandEventHandler):
         self.cmd_object_ = cmd_object
 
     def notify(self, args):
-        app = adsk.core.Application.cast(adsk.core.Application.get())
-        ui = app.userInterface
+        timer = self.cmd_object_.start_event_timer('activate')
 
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
             self.cmd_object_.command_inputs = command_inputs
 
-            input_values = self.cmd_object_.get_inputs()
+            self.cmd_object_.validation_dirty = True
+
+            input_values = self.cmd_object_.get_event_input_values(refresh=True)
+            timer.callback_started()
             self.cmd_object_.on_activate(command_, command_inputs, args, input_values)
+            timer.callback_finished()
+            self.cmd_object_._input_callback_finished()
+
+            timer.stop()
 
         except:
-            if ui:
-                ui.messageBox('Input changed event failed: {}'.format(traceback.format_exc()))
+            report_error('Activate event failed')
 
 
 class _MouseDragEndHandler(adsk.core.MouseEventHandler):
@@ -452,20 +983,22 @@ class _MouseDragEndHandler(adsk.core.MouseEventHandler):
         self.cmd_object_ = cmd_object
 
     def notify(self, args):
-        app = adsk.core.Application.cast(adsk.core.Application.get())
-        ui = app.userInterface
+        timer = self.cmd_object_.start_event_timer('mouse_drag_end')
 
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
             self.cmd_object_.command_inputs = command_inputs
 
-            input_values = self.cmd_object_.get_inputs()
+            input_values = self.cmd_object_.get_event_input_values()
+            timer.callback_started()
             self.cmd_object_.on_mouse_drag_end(command_, command_inputs, args, input_values)
+            timer.callback_finished()
+
+            timer.stop()
 
         except:
-            if ui:
-                ui.messageBox('Input changed event failed: {}'.format(traceback.format_exc()))
+            report_error('Mouse drag end event failed')
 
 
 class _DestroyHandler(adsk.core.CommandEventHandler):
@@ -474,18 +1007,25 @@ class _DestroyHandler(adsk.core.CommandEventHandler):
         self.cmd_object_ = cmd_object
 
     def notify(self, args):
+        timer = self.cmd_object_.start_event_timer('destroy')
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
             reason_ = args.terminationReason
 
-            input_values = self.cmd_object_.get_inputs()
+            self.cmd_object_.last_preview_fingerprint = None
+            if self.cmd_object_.preview_cache is not None:
+                self.cmd_object_.preview_cache.clear()
+
+            input_values = self.cmd_object_.get_event_input_values(refresh=True)
+            timer.callback_started()
             self.cmd_object_.on_destroy(command_, command_inputs, reason_, input_values)
+            timer.callback_finished()
+
+            timer.stop()
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Input changed event failed: {}'.format(traceback.format_exc()))
+            report_error('Destroy event failed')
 
 
 class _InputChangedHandler(adsk.core.InputChangedEventHandler):
@@ -494,19 +1034,34 @@ class _InputChangedHandler(adsk.core.InputChangedEventHandler):
         self.cmd_object_ = cmd_object
 
     def notify(self, args):
+        timer = self.cmd_object_.start_event_timer('input_changed')
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
             changed_input = args.input
 
-            input_values = self.cmd_object_.get_inputs()
+            self.cmd_object_.changed_keys = {changed_input.id}
+            self.cmd_object_._preview_changed_keys.add(changed_input.id)
+
+            depend_on = self.cmd_object_.validate_inputs_depend_on
+            if depend_on is not None and changed_input.id in depend_on:
+                self.cmd_object_.validation_dirty = True
+
+            input_values = self.cmd_object_.get_event_input_values(changed_input)
 
+            # Counted before on_input_changed runs, so get_preview_data is keyed correctly from there on
+            if changed_input.id not in self.cmd_object_.get_input_schema().fingerprinted_ids:
+                self.cmd_object_._unfingerprinted_changes += 1
+
+            timer.callback_started()
             self.cmd_object_.on_input_changed(command_, command_inputs, changed_input, input_values)
+            timer.callback_finished()
+            self.cmd_object_._input_callback_finished()
+
+            timer.stop()
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Input changed event failed: {}'.format(traceback.format_exc()))
+            report_error('Input changed event failed')
 
 
 class _CommandExecuteHandler(adsk.core.CommandEventHandler):
@@ -515,17 +1070,25 @@ class _CommandExecuteHandler(adsk.core.CommandEventHandler):
         self.cmd_object_ = cmd_object
 
     def notify(self, args):
+        timer = self.cmd_object_.start_event_timer('execute')
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
 
-            input_values = self.cmd_object_.get_inputs()
-            self.cmd_object_.on_execute(command_, command_inputs, args, input_values)
+            input_values = self.cmd_object_.get_event_input_values(refresh=True)
+            timer.callback_started()
+            if self.cmd_object_.execute_in_background:
+                data = self.cmd_object_.gather(command_, command_inputs, args, input_values)
+                timer.callback_finished()
+                self.cmd_object_.last_job = self.cmd_object_.fusion_app.start_background_job(self.cmd_object_, data)
+            else:
+                self.cmd_object_.on_execute(command_, command_inputs, args, input_values)
+                timer.callback_finished()
+
+            timer.stop()
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('command executed failed: {}'.format(traceback.format_exc()))
+            report_error('command executed failed')
 
 
 class _CommandValidateInputsHandler(adsk.core.ValidateInputsEventHandler):
@@ -534,20 +1097,35 @@ class _CommandValidateInputsHandler(adsk.core.ValidateInputsEventHandler):
         self.cmd_object_ = cmd_object
 
     def notify(self, args: adsk.core.ValidateInputsEventArgs):
+        timer = self.cmd_object_.start_event_timer('validate_inputs')
         try:
             command_ = args.firingEvent.sender
             command_inputs = command_.commandInputs
 
-            input_values = self.cmd_object_.get_inputs()
+            if self.cmd_object_.validate_inputs_depend_on is not None:
+                # None of the inputs the validation depends on changed, reuse the last result
+                if not self.cmd_object_.validation_dirty:
+                    args.areInputsValid = self.cmd_object_._last_validation_result
+                    self.cmd_object_.validations_avoided += 1
+                    timer.stop()
+                    return
+
+            input_values = self.cmd_object_.get_event_input_values()
+            timer.callback_started()
             are_inputs_valid = self.cmd_object_.validate_inputs(command_, command_inputs, args, input_values)
+            timer.callback_finished()
 
             if are_inputs_valid is not None:
                 args.areInputsValid = bool(are_inputs_valid)
 
+            if self.cmd_object_.validate_inputs_depend_on is not None:
+                self.cmd_object_._last_validation_result = args.areInputsValid
+                self.cmd_object_.validation_dirty = False
+
+            timer.stop()
+
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('command validate inputs failed: {}'.format(traceback.format_exc()))
+            report_error('command validate inputs failed')
 
 
 class _CommandCreatedEventHandler(adsk.core.CommandCreatedEventHandler):
@@ -557,44 +1135,23 @@ class _CommandCreatedEventHandler(adsk.core.CommandCreatedEventHandler):
 
     def notify(self, args):
         try:
-            global handlers
-            # handlers.clear()
-
             command: adsk.core.Command = args.command
             inputs_ = command.commandInputs
             self.cmd_object.command_inputs = inputs_
 
-            on_execute_handler = _CommandExecuteHandler(self.cmd_object)
-            command.execute.add(on_execute_handler)
-            handlers.append(on_execute_handler)
-
-            on_input_changed_handler = _InputChangedHandler(self.cmd_object)
-            command.inputChanged.add(on_input_changed_handler)
-            handlers.append(on_input_changed_handler)
-
-            on_destroy_handler = _DestroyHandler(self.cmd_object)
-            command.destroy.add(on_destroy_handler)
-            handlers.append(on_destroy_handler)
-
-            on_execute_preview_handler = _PreviewHandler(self.cmd_object)
-            command.executePreview.add(on_execute_preview_handler)
-            handlers.append(on_execute_preview_handler)
-
-            on_activate_handler = _ActivateHandler(self.cmd_object)
-            command.activate.add(on_activate_handler)
-            handlers.append(on_activate_handler)
-
-            on_mouse_drag_end_handler = _MouseDragEndHandler(self.cmd_object)
-            command.mouseDragEnd.add(on_mouse_drag_end_handler)
-            handlers.append(on_mouse_drag_end_handler)
-
-            validate_inputs_handler = _CommandValidateInputsHandler(self.cmd_object)
-            command.validateInputs.add(validate_inputs_handler)
-            handlers.append(validate_inputs_handler)
+            for event_name, handler in self.cmd_object.get_dialog_handlers():
+                getattr(command, event_name).add(handler)
 
+            self.cmd_object.input_schema = None
+            self.cmd_object.input_values_snapshot = None
+            self.cmd_object.last_preview_fingerprint = None
+            self.cmd_object.validation_dirty = True
             self.cmd_object.on_create(command, inputs_)
+            self.cmd_object._input_callback_finished()
+
+            # Everything is new to the first preview of the dialog
+            self.cmd_object.changed_keys = set(self.cmd_object.get_input_schema().by_id)
+            self.cmd_object._preview_changed_keys = set(self.cmd_object.changed_keys)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Command created failed: {}'.format(traceback.format_exc()))
+            report_error('Command created failed')
@@ -0,0 +1,493 @@
+"""
+Fusion360CommandInputs.py
+=========================
+Python module for reading the values of Fusion 360 Command Inputs
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import adsk.core
+
+import functools
+import keyword
+import re
+from collections.abc import MutableMapping
+from typing import Optional
+
+# Returned by an extractor when the input should not be included in the input values
+_MISSING = object()
+
+
+def _value(command_input):
+    return command_input.value
+
+
+def _slider_value(command_input):
+    return command_input.valueOne
+
+
+def _list_items(command_input):
+    return command_input.listItems
+
+
+def _selected_item_name(command_input):
+    selected_item = command_input.selectedItem
+    if selected_item is not None:
+        return selected_item.name
+    return None
+
+
+def _selected_item_name_or_missing(command_input):
+    selected_item = command_input.selectedItem
+    if selected_item is not None:
+        return selected_item.name
+    return _MISSING
+
+
+def _selection_entities(command_input):
+    selections = []
+    for i in range(0, command_input.selectionCount):
+        selections.append(command_input.selection(i).entity)
+    return selections
+
+
+def _name(command_input):
+    return command_input.name
+
+
+def _selection_tokens(command_input):
+    return tuple(command_input.selection(i).entity.entityToken for i in range(0, command_input.selectionCount))
+
+
+def _list_item_states(command_input):
+    list_items = command_input.listItems
+    return tuple(list_items.item(i).isSelected for i in range(0, list_items.count))
+
+
+def _slider_values(command_input):
+    if command_input.hasTwoValues:
+        return command_input.valueOne, command_input.valueTwo
+    return command_input.valueOne
+
+
+def _is_direction_flipped(command_input):
+    return command_input.isDirectionFlipped
+
+
+def _formatted_text(command_input):
+    return command_input.formattedText
+
+
+# How an input is fingerprinted when it is not by its value, None if it can't be fingerprinted
+_fingerprinters_by_extractor = {
+    _selection_entities: _selection_tokens,
+    _list_items: _list_item_states,
+    _name: None
+}
+
+_fingerprinters_by_type: Optional[dict] = None
+
+
+def _get_fingerprinters_by_type() -> dict:
+    global _fingerprinters_by_type
+
+    if _fingerprinters_by_type is None:
+        # Inputs whose input value doesn't capture their state
+        _fingerprinters_by_type = {
+            adsk.core.AngleValueCommandInput.classType(): _value,
+            adsk.core.DirectionCommandInput.classType(): _is_direction_flipped,
+            adsk.core.FloatSliderCommandInput.classType(): _slider_values,
+            adsk.core.IntegerSliderCommandInput.classType(): _slider_values,
+            adsk.core.TextBoxCommandInput.classType(): _formatted_text
+        }
+
+    return _fingerprinters_by_type
+
+
+def _get_fingerprinter(object_type: str, extractor):
+    fingerprinter = _get_fingerprinters_by_type().get(object_type, None)
+    if fingerprinter is not None:
+        return fingerprinter
+    return _fingerprinters_by_extractor.get(extractor, extractor)
+
+
+_extractors_by_type: Optional[dict] = None
+
+
+def _get_extractors_by_type() -> dict:
+    global _extractors_by_type
+
+    if _extractors_by_type is None:
+        _extractors_by_type = {}
+
+        # If the input type is in this list the value of the input is returned
+        for input_type in [adsk.core.BoolValueCommandInput, adsk.core.DistanceValueCommandInput,
+                           adsk.core.FloatSpinnerCommandInput, adsk.core.IntegerSpinnerCommandInput,
+                           adsk.core.ValueCommandInput, adsk.core.StringValueCommandInput]:
+            _extractors_by_type[input_type.classType()] = _value
+
+        for input_type in [adsk.core.FloatSliderCommandInput, adsk.core.IntegerSliderCommandInput]:
+            _extractors_by_type[input_type.classType()] = _slider_value
+
+        # TODO need to account for radio and button multi select also
+        # If the input type is in this list the name of the selected list item is returned
+        for input_type in [adsk.core.ButtonRowCommandInput, adsk.core.RadioButtonGroupCommandInput]:
+            _extractors_by_type[input_type.classType()] = _selected_item_name
+
+        # If the input type is a selection an array of entities is returned
+        _extractors_by_type[adsk.core.SelectionCommandInput.classType()] = _selection_entities
+
+    return _extractors_by_type
+
+
+def _get_extractor(command_input, object_type: str):
+    if object_type == adsk.core.DropDownCommandInput.classType():
+        if command_input.dropDownStyle == adsk.core.DropDownStyles.CheckBoxDropDownStyle:
+            return _list_items
+        return _selected_item_name_or_missing
+
+    return _get_extractors_by_type().get(object_type, _name)
+
+
+def _attribute_name(input_id: str, used: set) -> str:
+    name = re.sub(r'\W', '_', input_id)
+    if not name or name[0].isdigit() or name[0] == '_':
+        name = 'i_' + name
+    if keyword.iskeyword(name):
+        name += '_'
+
+    unique_name = name
+    index = 2
+    while unique_name in used:
+        unique_name = '{}_{}'.format(name, index)
+        index += 1
+    used.add(unique_name)
+    return unique_name
+
+
+class InputSnapshot:
+    """Base class of the generated snapshot classes, see :meth:`InputSchema.get_snapshot_class`
+
+    Each input value is an attribute named after the input id.
+    Ids that are not valid identifiers have invalid characters replaced by '_',
+    see _fields for the attribute of each input id.
+    Drop downs without a selected item have the value None.
+    """
+
+    __slots__ = ()
+
+    # Set on each generated class
+    _fields = {}
+    _inputs = {}
+
+    def _value(self, input_id: str):
+        """Returns the value of an input by its id"""
+        return getattr(self, self._fields[input_id])
+
+    def _input(self, input_id: str) -> adsk.core.CommandInput:
+        """Returns the command input itself by its id"""
+        return self._inputs[input_id]
+
+    def _asdict(self) -> dict:
+        """Returns the values as a dictionary keyed by input id"""
+        return {input_id: getattr(self, attribute) for input_id, attribute in self._fields.items()}
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(attribute, getattr(self, attribute)) for attribute in self.__slots__
+        ))
+
+
+@functools.lru_cache(maxsize=32)
+def _get_values_snapshot_class(input_ids: tuple, class_name: str) -> type:
+    used = set()
+    fields = {input_id: _attribute_name(input_id, used) for input_id in input_ids}
+    return type(class_name, (InputSnapshot,), {
+        '__slots__': tuple(fields.values()),
+        '_fields': fields,
+        '_inputs': {}
+    })
+
+
+def make_input_snapshot(input_values: dict, class_name: str = 'InputValues') -> InputSnapshot:
+    """Creates a snapshot from a dictionary of input values, i.e. to run a command without its dialog
+
+    Keys ending in '_input' are ignored and the snapshot has no command inputs, _input raises a KeyError.
+
+    Args:
+        input_values: The value of each input keyed by input id
+        class_name: Name of the generated class
+
+    Returns:
+        An instance of a subclass of :class:`InputSnapshot`
+    """
+    input_ids = tuple(key for key in input_values if not key.endswith('_input'))
+    snapshot = _get_values_snapshot_class(input_ids, class_name)()
+    for input_id, attribute in snapshot._fields.items():
+        setattr(snapshot, attribute, input_values[input_id])
+    return snapshot
+
+
+class InputSchema:
+    """Classification of the inputs in a command dialog
+
+    Each input is classified once when the schema is built.
+    Reading the input values afterwards only reads the live value of each input.
+
+    Args:
+        command_inputs: The command inputs of the dialog
+    """
+
+    def __init__(self, command_inputs: adsk.core.CommandInputs):
+        self.count = command_inputs.count
+        self.entries = []
+        self.by_id = {}
+        self.by_key = {}
+        self.fingerprinted_ids = set()
+        self._fingerprinters = []
+
+        for i in range(0, self.count):
+            command_input = command_inputs.item(i)
+            input_id = command_input.id
+            object_type = command_input.objectType
+            extractor = _get_extractor(command_input, object_type)
+            entry = (input_id, input_id + '_input', command_input, extractor)
+            self.entries.append(entry)
+            self.by_id[input_id] = entry
+            self.by_key[entry[0]] = entry
+            self.by_key[entry[1]] = entry
+
+            fingerprinter = _get_fingerprinter(object_type, extractor)
+            if fingerprinter is not None:
+                self._fingerprinters.append((input_id, command_input, fingerprinter))
+                self.fingerprinted_ids.add(input_id)
+
+        self._snapshot_class = None
+        self._snapshot_readers = None
+
+    def is_current(self, command_inputs: adsk.core.CommandInputs, check_last: bool = True) -> bool:
+        """Whether the dialog still has the inputs the schema was built from
+
+        Fusion adds new inputs after the existing ones, so when an input is deleted and another one added
+        the last input changes, even if the new input has the same id.
+        Checking the count and the last input therefore takes two API calls whatever the size of the dialog.
+
+        Args:
+            command_inputs: The command inputs of the dialog
+            check_last: If False only the number of inputs is compared
+        """
+        count = command_inputs.count
+        if count != self.count:
+            return False
+        if not check_last or count == 0:
+            return True
+        return command_inputs.item(count - 1) == self.entries[-1][2]
+
+    def get_values(self) -> dict:
+        """Reads the current value of all inputs
+
+        Returns:
+            A dictionary with the value of each input keyed by its id, and the input itself keyed by id + '_input'
+        """
+        input_values = {}
+        for input_id, input_key, command_input, extractor in self.entries:
+            value = extractor(command_input)
+            if value is not _MISSING:
+                input_values[input_id] = value
+                input_values[input_key] = command_input
+        return input_values
+
+    def get_snapshot_class(self, class_name: str = 'InputValues') -> type:
+        """Returns a class with one slot per input, generated once for the dialog layout
+
+        Args:
+            class_name: Name of the generated class
+
+        Returns:
+            A subclass of :class:`InputSnapshot`
+        """
+        if self._snapshot_class is None:
+            used = set()
+            fields = {}
+            inputs = {}
+            readers = []
+            for input_id, input_key, command_input, extractor in self.entries:
+                attribute = _attribute_name(input_id, used)
+                fields[input_id] = attribute
+                inputs[input_id] = command_input
+                readers.append((attribute, command_input, extractor))
+
+            self._snapshot_class = type(class_name, (InputSnapshot,), {
+                '__slots__': tuple(fields.values()),
+                '_fields': fields,
+                '_inputs': inputs
+            })
+            self._snapshot_readers = readers
+
+        return self._snapshot_class
+
+    def get_snapshot(self) -> InputSnapshot:
+        """Reads the current value of all inputs into an instance of the snapshot class
+
+        Returns:
+            An instance of the class returned by get_snapshot_class
+        """
+        snapshot = self.get_snapshot_class()()
+        for attribute, command_input, extractor in self._snapshot_readers:
+            value = extractor(command_input)
+            if value is _MISSING:
+                value = None
+            setattr(snapshot, attribute, value)
+        return snapshot
+
+    def get_fingerprint(self) -> tuple:
+        """Reads a hashable fingerprint of the current value of all inputs
+
+        Scalar values are used as is, selections by the entity tokens of the selected entities
+        and check box drop downs by the selection state of their items.
+        Angles, directions, both values of sliders and the text of text boxes are included as well.
+        Other inputs, such as tables and groups, can't be fingerprinted, see fingerprinted_ids.
+
+        Returns:
+            A tuple that compares equal when the inputs have the same values
+        """
+        return tuple((input_id, fingerprinter(command_input))
+                     for input_id, command_input, fingerprinter in self._fingerprinters)
+
+    def update_value(self, input_values: dict, input_id: str) -> bool:
+        """Updates the value of a single input in an existing dictionary of input values
+
+        Args:
+            input_values: A dictionary previously returned by get_values
+            input_id: The id of the input that changed
+
+        Returns:
+            False if the input is not part of the schema, the dictionary is unchanged in that case
+        """
+        entry = self.by_id.get(input_id, None)
+        if entry is None:
+            return False
+
+        input_id, input_key, command_input, extractor = entry
+        value = extractor(command_input)
+        if value is not _MISSING:
+            input_values[input_id] = value
+            input_values[input_key] = command_input
+        else:
+            input_values.pop(input_id, None)
+            input_values.pop(input_key, None)
+        return True
+
+
+    def update_changed_values(self, input_values: dict, previous_schema: 'InputSchema'):
+        """Updates input values read with a previous schema of the same dialog
+
+        Only inputs that were added or replaced since the previous schema are read,
+        the values of removed inputs are deleted.
+
+        Args:
+            input_values: A dictionary previously returned by get_values of previous_schema
+            previous_schema: The schema the dictionary was read with
+        """
+        for input_id, input_key, command_input, extractor in previous_schema.entries:
+            if input_id not in self.by_id:
+                input_values.pop(input_id, None)
+                input_values.pop(input_key, None)
+
+        for input_id, input_key, command_input, extractor in self.entries:
+            previous_entry = previous_schema.by_id.get(input_id, None)
+            if previous_entry is None or previous_entry[2] != command_input:
+                self.update_value(input_values, input_id)
+            elif input_key in input_values:
+                input_values[input_key] = command_input
+
+
+class LazyInputValues(MutableMapping):
+    """Input values that are only read from Fusion when they are first accessed
+
+    Behaves like the dictionary returned by get_inputs, but the value of each input is only read
+    (and then remembered) the first time its key is accessed.
+    Modifying the mapping reads all remaining values and it then behaves as a plain dictionary.
+
+    Args:
+        schema: The input schema of the dialog
+    """
+
+    def __init__(self, schema: InputSchema):
+        self._schema = schema
+        self._values = {}
+        self._data: Optional[dict] = None
+
+    def _fetch(self, entry):
+        input_id, input_key, command_input, extractor = entry
+        value = self._values.get(input_id, self)
+        if value is self:
+            value = extractor(command_input)
+            self._values[input_id] = value
+        return value
+
+    def _is_present(self, entry) -> bool:
+        # Only a drop down without a selected item can be missing, no need to read any other value
+        if entry[3] is not _selected_item_name_or_missing:
+            return True
+        return self._fetch(entry) is not _MISSING
+
+    def __getitem__(self, key):
+        if self._data is not None:
+            return self._data[key]
+
+        entry = self._schema.by_key.get(key, None)
+        if entry is None:
+            raise KeyError(key)
+
+        if key != entry[0]:
+            # The input itself, its value is only read if it could be missing
+            if not self._is_present(entry):
+                raise KeyError(key)
+            return entry[2]
+
+        value = self._fetch(entry)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        if self._data is not None:
+            return key in self._data
+
+        entry = self._schema.by_key.get(key, None)
+        return entry is not None and self._is_present(entry)
+
+    def __iter__(self):
+        if self._data is not None:
+            yield from self._data
+            return
+
+        for entry in self._schema.entries:
+            if self._is_present(entry):
+                yield entry[0]
+                yield entry[1]
+
+    def __len__(self):
+        if self._data is not None:
+            return len(self._data)
+        return 2 * sum(1 for entry in self._schema.entries if self._is_present(entry))
+
+    def _materialize(self) -> dict:
+        if self._data is None:
+            self._data = {key: self[key] for key in self}
+        return self._data
+
+    def copy(self) -> dict:
+        """Returns the input values as a plain dictionary, reading any value not read yet"""
+        return dict(self._materialize())
+
+    def __setitem__(self, key, value):
+        self._materialize()[key] = value
+
+    def __delitem__(self, key):
+        del self._materialize()[key]
+
+    def __repr__(self):
+        return repr(dict(self))
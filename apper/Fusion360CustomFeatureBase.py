@@ -6,14 +6,15 @@ Python module for creating a Fusion 360 Custom Feature
 :copyright: (c) 2019 by Patrick Rainsberry.
 :license: Apache 2.0, see LICENSE for more details.
 """
-import traceback
-
 import adsk.core
 import adsk.fusion
 
 import os.path
 
+from .Fusion360ErrorSink import report_error
+
 
+# Handlers are kept by the feature objects that own them
 handlers = []
 
 
@@ -45,6 +46,7 @@ class Fusion360CustomFeatureBase:
         # self.feature_edit_id = self.fusion_app.command_id_from_name('offset_b_box_edit')
 
         self.definition = definition
+        self.compute_handler = None
 
     def on_compute(self, args: adsk.fusion.CustomFeatureEventArgs):
         pass
@@ -59,7 +61,7 @@ class Fusion360CustomFeatureBase:
         compute_event = self.definition.customFeatureCompute
         on_compute_handler = _CustomFeatureComputeHandler(self)
         compute_event.add(on_compute_handler)
-        handlers.append(on_compute_handler)
+        self.compute_handler = on_compute_handler
 
         # edit_event = definition.customFeatureCompute
         # on_edit_handler = _CustomFeatureEditHandler(self)
@@ -84,9 +86,7 @@ class _CustomFeatureComputeHandler(adsk.fusion.CustomFeatureEventHandler):
             self.cmd_object_.on_compute(args)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('command executed failed: {}'.format(traceback.format_exc()))
+            report_error('Custom feature compute failed')
 
 
 class _CustomFeatureEditHandler(adsk.fusion.CustomFeatureEventHandler):
@@ -103,6 +103,4 @@ class _CustomFeatureEditHandler(adsk.fusion.CustomFeatureEventHandler):
             self.cmd_object_.on_edit(args)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('command executed failed: {}'.format(traceback.format_exc()))
+            report_error('Custom feature edit failed')
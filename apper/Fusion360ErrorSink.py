@@ -0,0 +1,234 @@
+"""
+Fusion360ErrorSink.py
+=====================
+Python module for reporting the errors raised in Fusion 360 event handlers
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+
+import adsk.core
+
+from typing import Optional
+
+
+class _ErrorRecord:
+    """Occurrences of errors with the same signature"""
+
+    def __init__(self, context: str, exception: str):
+        self.context = context
+        self.exception = exception
+        self.count = 0
+        self.unreported = 0
+        self.last_time = 0.0
+        self.last_notified: Optional[float] = None
+
+
+class _NotifyEventHandler(adsk.core.CustomEventHandler):
+    def __init__(self, error_sink: 'ErrorSink'):
+        super().__init__()
+        self.error_sink = error_sink
+
+    def notify(self, args):
+        """Method overwritten on parent class that will be executed when the event fires
+
+        Args:
+            args: event arguments
+        """
+        self.error_sink.flush_notifications()
+
+
+class ErrorSink:
+    """Collects the errors raised in event handlers
+
+    Errors are grouped by signature, the exception type and the location of each frame of its traceback.
+    Each occurrence is counted, the full traceback is logged from a background thread and,
+    at most once per signature every window seconds, a message is written to the Text Commands palette.
+    Unlike a message box this does not block Fusion 360, so an error in a frequent event such as
+    executePreview cannot freeze the session.
+
+    The Fusion 360 API is only used on the main thread.  Notifications of errors reported from other threads
+    are queued and shown when the custom event set up by :meth:`register_notify_event` fires,
+    or otherwise with the next error reported on the main thread.
+
+    Args:
+        window: Minimum number of seconds between two notifications of the same error
+        logger: Logger that receives the tracebacks, by default the 'apper' logger
+    """
+
+    def __init__(self, window: float = 30.0, logger: Optional[logging.Logger] = None):
+        self.window = window
+        self.logger = logger if logger is not None else logging.getLogger('apper')
+        self.records = {}
+        self._lock = threading.Lock()
+        self._log_queue = queue.SimpleQueue()
+        self._log_thread: Optional[threading.Thread] = None
+        self._pending_notifications = queue.SimpleQueue()
+        self.notify_event_id: Optional[str] = None
+        self.notify_handler: Optional[_NotifyEventHandler] = None
+
+    def report(self, context: str, exc_info=None) -> bool:
+        """Reports an error, call this from an except block
+
+        Args:
+            context: Short description of where the error happened, i.e. 'Input changed event failed'
+            exc_info: The (type, value, traceback) of the error, by default the exception being handled
+
+        Returns:
+            True if a notification was shown for this occurrence
+        """
+        if exc_info is None:
+            exc_info = sys.exc_info()
+        exc_type, exc_value, exc_traceback = exc_info
+
+        frames = tuple((frame.filename, frame.lineno, frame.name) for frame in traceback.extract_tb(exc_traceback))
+        signature = (context, getattr(exc_type, '__name__', str(exc_type)), frames)
+
+        now = time.monotonic()
+        with self._lock:
+            record = self.records.get(signature, None)
+            if record is None:
+                record = _ErrorRecord(context, traceback.format_exception_only(exc_type, exc_value)[-1].strip())
+                self.records[signature] = record
+            record.count += 1
+            record.last_time = now
+
+            notify = record.last_notified is None or now - record.last_notified >= self.window
+            if notify:
+                repeated = record.unreported
+                record.unreported = 0
+                record.last_notified = now
+            else:
+                record.unreported += 1
+
+        if notify:
+            # Only formatted when it is reported, repeated errors cost little more than the signature
+            text = ''.join(traceback.format_exception(exc_type, exc_value, exc_traceback))
+            self._log(logging.ERROR, '{}:\n{}'.format(context, text))
+            if threading.current_thread() is threading.main_thread():
+                self.flush_notifications()
+                self._notify(context, text, repeated)
+            else:
+                self._pending_notifications.put((context, text, repeated))
+                self._fire_notify_event()
+        return notify
+
+    def _log(self, level: int, message: str):
+        self._log_queue.put((level, message))
+        if self._log_thread is None:
+            with self._lock:
+                if self._log_thread is None:
+                    self._log_thread = threading.Thread(target=self._log_worker, name='apper-error-log', daemon=True)
+                    self._log_thread.start()
+
+    def _log_worker(self):
+        while True:
+            level, message = self._log_queue.get()
+            try:
+                self.logger.log(level, message)
+            except:
+                pass
+
+    def register_notify_event(self, event_id: str):
+        """Registers the custom event that shows notifications of errors reported from other threads
+
+        Call this from the main thread.
+
+        Args:
+            event_id: Unique id of the custom event
+        """
+        app = adsk.core.Application.get()
+        app.unregisterCustomEvent(event_id)
+        custom_event = app.registerCustomEvent(event_id)
+        self.notify_handler = _NotifyEventHandler(self)
+        custom_event.add(self.notify_handler)
+        self.notify_event_id = event_id
+
+    def unregister_notify_event(self):
+        """Unregisters the custom event set up by register_notify_event, call this from the main thread"""
+        if self.notify_event_id is not None:
+            app = adsk.core.Application.get()
+            app.unregisterCustomEvent(self.notify_event_id)
+            self.notify_event_id = None
+            self.notify_handler = None
+
+    def _fire_notify_event(self):
+        # fireCustomEvent is the only Fusion 360 API call that is safe from other threads
+        event_id = self.notify_event_id
+        if event_id is not None:
+            try:
+                adsk.core.Application.get().fireCustomEvent(event_id, '')
+            except:
+                pass
+
+    def flush_notifications(self):
+        """Shows the queued notifications of errors reported from other threads, call this from the main thread"""
+        while True:
+            try:
+                context, text, repeated = self._pending_notifications.get_nowait()
+            except queue.Empty:
+                return
+            self._notify(context, text, repeated)
+
+    def _notify(self, context: str, text: str, repeated: int):
+        message = '{}:\n{}'.format(context, text)
+        if repeated > 0:
+            message += '(This error occurred {} more times since it was last reported)\n'.format(repeated)
+
+        try:
+            app = adsk.core.Application.get()
+            ui = app.userInterface
+            palette = ui.palettes.itemById('TextCommands')
+            if palette:
+                palette.isVisible = True
+                palette.writeText(message)
+        except:
+            pass
+
+    def get_summary(self) -> list:
+        """Summary of the reported errors
+
+        Returns:
+            A list of dictionaries with the context, exception and number of occurrences of each error
+        """
+        with self._lock:
+            return [
+                {'context': record.context, 'exception': record.exception, 'count': record.count}
+                for record in self.records.values()
+            ]
+
+    def clear(self):
+        """Forgets all reported errors"""
+        with self._lock:
+            self.records = {}
+
+
+_error_sink: Optional[ErrorSink] = None
+
+
+def get_error_sink() -> ErrorSink:
+    """Returns the error sink shared by all apper event handlers"""
+    global _error_sink
+
+    if _error_sink is None:
+        _error_sink = ErrorSink()
+    return _error_sink
+
+
+def report_error(context: str) -> bool:
+    """Reports the exception being handled to the shared error sink, see :meth:`ErrorSink.report`
+
+    Args:
+        context: Short description of where the error happened
+
+    Returns:
+        True if a notification was shown for this occurrence
+    """
+    return get_error_sink().report(context)
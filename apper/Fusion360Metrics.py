@@ -0,0 +1,197 @@
+"""
+Fusion360Metrics.py
+===================
+Python module for measuring the latency of Fusion 360 command events
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import time
+from collections import deque
+
+from .Fusion360Preferences import write_json_file
+
+
+class LatencyHistogram:
+    """Latency samples of one kind of event
+
+    The count and max cover every sample, percentiles are computed from the most recent samples.
+
+    Args:
+        window: Number of recent samples used for percentiles
+    """
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        """Adds a sample
+
+        Args:
+            seconds: The measured latency in seconds
+        """
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> float:
+        """Returns a percentile of the recent samples
+
+        Args:
+            percent: The percentile, between 0 and 100
+
+        Returns:
+            The latency in seconds, 0 if there are no samples
+        """
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        index = int(round(percent / 100.0 * (len(samples) - 1)))
+        return samples[index]
+
+    def get_summary(self) -> dict:
+        """Summary of the samples, all times in seconds
+
+        Returns:
+            A dictionary with count, p50, p95 and max
+        """
+        return {
+            'count': self.count,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'max': self.max
+        }
+
+
+class _EventTimer:
+    """Measures one event, splitting framework time from the time spent in the user callback"""
+
+    __slots__ = ('_metrics', '_event_name', '_start', '_callback_start', '_callback_time', '_called')
+
+    def __init__(self, metrics: 'CommandMetrics', event_name: str):
+        self._metrics = metrics
+        self._event_name = event_name
+        self._callback_start = 0.0
+        self._callback_time = 0.0
+        self._called = False
+        self._start = time.perf_counter()
+
+    def callback_started(self):
+        self._callback_start = time.perf_counter()
+
+    def callback_finished(self):
+        self._callback_time += time.perf_counter() - self._callback_start
+        self._called = True
+
+    def stop(self):
+        total_time = time.perf_counter() - self._start
+        self._metrics.get_histogram(self._event_name, 'framework').record(total_time - self._callback_time)
+        if self._called:
+            self._metrics.get_histogram(self._event_name, 'callback').record(self._callback_time)
+
+
+class _NullTimer:
+    """Used when metrics are disabled, does nothing"""
+
+    __slots__ = ()
+
+    def callback_started(self):
+        pass
+
+    def callback_finished(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class CommandMetrics:
+    """Latency histograms of the events of a single command
+
+    Each event has a framework histogram, the time spent in apper itself such as reading input values,
+    and a callback histogram, the time spent in your method such as on_preview.
+
+    Args:
+        window: Number of recent samples used for percentiles
+    """
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self.histograms = {}
+
+    def get_histogram(self, event_name: str, part: str) -> LatencyHistogram:
+        """Returns the histogram of one part of an event, creating it if necessary
+
+        Args:
+            event_name: Name of the event, i.e. 'preview'
+            part: Either 'framework' or 'callback'
+        """
+        key = (event_name, part)
+        histogram = self.histograms.get(key, None)
+        if histogram is None:
+            histogram = LatencyHistogram(self.window)
+            self.histograms[key] = histogram
+        return histogram
+
+    def start_timer(self, event_name: str) -> _EventTimer:
+        """Starts measuring an event
+
+        Args:
+            event_name: Name of the event, i.e. 'preview'
+        """
+        return _EventTimer(self, event_name)
+
+    def get_summary(self) -> dict:
+        """Summary of all histograms
+
+        Returns:
+            A dictionary keyed by event name, then by 'framework' or 'callback', see LatencyHistogram.get_summary
+        """
+        summary = {}
+        for (event_name, part), histogram in self.histograms.items():
+            summary.setdefault(event_name, {})[part] = histogram.get_summary()
+        return summary
+
+    def clear(self):
+        """Discards all samples"""
+        self.histograms = {}
+
+
+def write_metrics_json(file_name: str, metrics: dict):
+    """Writes metrics as returned by FusionApp.get_metrics to a json file
+
+    Args:
+        file_name: full path to the json file
+        metrics: the metrics dictionary
+    """
+    write_json_file(file_name, metrics)
+
+
+def write_metrics_csv(file_name: str, metrics: dict):
+    """Writes metrics as returned by FusionApp.get_metrics to a csv file, one row per histogram
+
+    Args:
+        file_name: full path to the csv file
+        metrics: the metrics dictionary
+    """
+    import csv
+
+    with open(file_name, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['command', 'event', 'part', 'count', 'p50', 'p95', 'max'])
+        for command_id, events in metrics.items():
+            for event_name, parts in events.items():
+                for part, summary in parts.items():
+                    writer.writerow([
+                        command_id, event_name, part,
+                        summary['count'], summary['p50'], summary['p95'], summary['max']
+                    ])
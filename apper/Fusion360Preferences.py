@@ -0,0 +1,420 @@
+"""
+Fusion360Preferences.py
+=======================
+Python module for storing the preferences of a Fusion 360 Addin
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import json
+import os
+import threading
+from urllib.parse import quote, unquote
+
+from typing import Optional
+
+
+def read_json_file(file_name: str) -> dict:
+    """Read a json file and return a dictionary object
+
+    If the file does not exist or cannot be interpreted as a JSON object an empty dictionary is returned
+
+    Args:
+        file_name: full path to the json file
+
+    Returns:
+        Input file as a dictionary
+    """
+    if os.path.exists(file_name):
+        with open(file_name) as f:
+            try:
+                new_dict = json.load(f)
+            except:
+                new_dict = {}
+    else:
+        new_dict = {}
+
+    return new_dict
+
+
+def write_json_file(file_name: str, data: dict):
+    """Atomically write a dictionary to a json file
+
+    The data is written to a temporary file that then replaces the target,
+    so a crash while writing never leaves a truncated file behind.
+
+    Args:
+        file_name: full path to the json file
+        data: the dictionary to write
+    """
+    data_text = json.dumps(data)
+
+    temp_name = "{}.{}-{}.tmp".format(file_name, os.getpid(), threading.get_ident())
+    try:
+        with open(temp_name, "w") as f:
+            f.write(data_text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_name, file_name)
+    except:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+        raise
+
+
+class _JsonFile:
+    """Parsed contents of a json file along with the file state it was parsed from"""
+
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.data: Optional[dict] = None
+        self._signature = None
+        self._last_signature = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.file_name)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_current(self) -> bool:
+        """Whether the parsed data still matches the file on disk"""
+        self._last_signature = self._file_signature()
+        return self.data is not None and self._last_signature == self._signature
+
+    def exists(self) -> bool:
+        """Whether the file existed the last time it was checked"""
+        return self._last_signature is not None
+
+    def load(self):
+        self.data = read_json_file(self.file_name)
+        self._signature = self._last_signature
+
+    def write(self, data: dict):
+        write_json_file(self.file_name, data)
+        self.data = data
+        self._signature = self._last_signature = self._file_signature()
+
+    def remove(self):
+        if os.path.exists(self.file_name):
+            os.remove(self.file_name)
+        self.data = None
+        self._signature = self._last_signature = None
+
+
+class PreferenceStore:
+    """In memory cache of a json preferences file
+
+    The file is parsed once and all reads are then served from memory.
+    It is only parsed again when its modification time or size changes on disk.
+
+    Note the dictionaries returned by this class are the cached objects, treat them as read only.
+
+    If a write_delay is set, writes are held in memory and successive writes are coalesced into a single
+    write to disk once no new write has been made for write_delay seconds.  Call flush to write immediately.
+
+    Args:
+        file_name: full path to the preferences file
+        write_delay: Seconds to wait before writing changes to disk.  If None changes are written immediately.
+    """
+
+    def __init__(self, file_name: str, write_delay: Optional[float] = None):
+        self.file_name = file_name
+        self.write_delay = write_delay
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.coalesced_writes = 0
+        self._file = _JsonFile(file_name)
+        self._pending: Optional[dict] = None
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+
+    def _read(self, json_file: _JsonFile) -> dict:
+        if json_file.is_current():
+            self.hits += 1
+        else:
+            self.misses += 1
+            json_file.load()
+        return json_file.data
+
+    def _has_pending(self) -> bool:
+        return self._pending is not None
+
+    def exists(self) -> bool:
+        """Whether the preferences file exists on disk or is waiting to be written"""
+        return self._has_pending() or os.path.exists(self.file_name)
+
+    def get_all(self) -> dict:
+        """Gets all preferences, reading the file only if it changed since the last read
+
+        Returns:
+            All preferences as a dictionary
+        """
+        with self._lock:
+            # Pending changes are newer than anything on disk
+            if self._pending is not None:
+                self.hits += 1
+                return self._pending
+
+            return self._read(self._file)
+
+    def get_group(self, group_name: str) -> Optional[dict]:
+        """Gets the preferences of a single group
+
+        Args:
+            group_name: name of parent group
+
+        Returns:
+            The group preferences or None if the group does not exist
+        """
+        return self.get_all().get(group_name, None)
+
+    def write_group(self, group_name: str, group_preferences: dict):
+        """Writes the preferences of a single group
+
+        Args:
+            group_name: name of parent group
+            group_preferences: the new preferences for the group
+        """
+        with self._lock:
+            all_preferences = dict(self.get_all())
+            all_preferences[group_name] = group_preferences
+            self.write_all(all_preferences)
+
+    def write_all(self, preferences: dict):
+        """Writes all preferences and updates the cache
+
+        If a write_delay is set the write to disk is deferred, otherwise it happens immediately.
+
+        Args:
+            preferences: the full preferences dictionary
+        """
+        with self._lock:
+            if self._has_pending():
+                self.coalesced_writes += 1
+            self._pending = preferences
+            self._schedule_write()
+
+    def _schedule_write(self):
+        if self.write_delay is None:
+            self.flush()
+            return
+
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(self.write_delay, self._flush_on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """Writes any pending changes to disk immediately"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self._has_pending():
+                self._write_pending()
+
+    def _flush_on_timer(self):
+        try:
+            self.flush()
+        except:
+            # Changes stay pending and will be retried on the next flush
+            pass
+
+    def _write_pending(self):
+        self._file.write(self._pending)
+        self._pending = None
+        self.writes += 1
+
+    def invalidate(self):
+        """Forces the next read to parse from disk, discarding any pending changes"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._discard()
+
+    def _discard(self):
+        self._pending = None
+        self._file = _JsonFile(self.file_name)
+
+    def get_stats(self) -> dict:
+        """Cache statistics
+
+        Returns:
+            A dictionary with the number of cache hits and misses, file writes and coalesced writes
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'coalesced_writes': self.coalesced_writes
+        }
+
+
+def _name_hash(group_name: str) -> str:
+    import hashlib
+
+    return hashlib.sha1(group_name.encode('utf-8')).hexdigest()[:8]
+
+
+class ShardedPreferenceStore(PreferenceStore):
+    """Preference store that keeps each preference group in its own json file
+
+    Saving a group only rewrites that group's file, so the cost of a save does not grow with the number of groups.
+    Each group file is cached and only parsed again when it changes on disk.
+
+    The file of a group is named after the group and a short hash of its exact name,
+    so groups that only differ in case don't share a file on case-insensitive file systems.
+
+    If the directory does not exist yet and a single file preferences.json is given as legacy_file_name,
+    its groups are migrated to individual files on first use.  The legacy file is left in place.
+
+    Args:
+        directory: full path to the directory that will contain one json file per group
+        legacy_file_name: full path to an existing single file store to migrate from
+        write_delay: Seconds to wait before writing changes to disk.  If None changes are written immediately.
+    """
+
+    def __init__(self, directory: str, legacy_file_name: Optional[str] = None, write_delay: Optional[float] = None):
+        super().__init__(directory, write_delay)
+        self.directory = directory
+        self.legacy_file_name = legacy_file_name
+        self._files = {}
+        self._pending_groups = {}
+        self._pending_deletes = set()
+        self._migrated = False
+
+    def _group_file(self, group_name: str) -> _JsonFile:
+        json_file = self._files.get(group_name, None)
+        if json_file is None:
+            file_name = os.path.join(
+                self.directory, "{}.{}.json".format(quote(group_name, safe=''), _name_hash(group_name))
+            )
+            json_file = _JsonFile(file_name)
+            self._files[group_name] = json_file
+        return json_file
+
+    def _migrate(self):
+        if self._migrated:
+            return
+        self._migrated = True
+
+        if os.path.isdir(self.directory):
+            return
+        os.makedirs(self.directory)
+
+        if self.legacy_file_name is not None and os.path.exists(self.legacy_file_name):
+            for group_name, group_preferences in read_json_file(self.legacy_file_name).items():
+                self._group_file(group_name).write(group_preferences)
+
+    def _stored_group_names(self) -> set:
+        group_names = set()
+        for file_name in os.listdir(self.directory):
+            quoted_name, _, name_hash = file_name[:-len(".json")].rpartition('.')
+            if file_name.endswith(".json") and quoted_name:
+                group_name = unquote(quoted_name)
+                # Ignores any other json file in the directory
+                if _name_hash(group_name) == name_hash:
+                    group_names.add(group_name)
+        return group_names
+
+    def _has_pending(self) -> bool:
+        return bool(self._pending_groups) or bool(self._pending_deletes)
+
+    def exists(self) -> bool:
+        """Whether any group has been stored or is waiting to be written"""
+        with self._lock:
+            self._migrate()
+            return self._has_pending() or len(self._stored_group_names()) > 0
+
+    def get_all(self) -> dict:
+        """Gets all preferences, reading only the group files that changed since the last read
+
+        Returns:
+            All preferences as a dictionary
+        """
+        with self._lock:
+            self._migrate()
+            group_names = (self._stored_group_names() | set(self._pending_groups)) - self._pending_deletes
+            all_preferences = {}
+            for group_name in group_names:
+                group_preferences = self.get_group(group_name)
+                if group_preferences is not None:
+                    all_preferences[group_name] = group_preferences
+            return all_preferences
+
+    def get_group(self, group_name: str) -> Optional[dict]:
+        """Gets the preferences of a single group, reading only that group's file
+
+        Args:
+            group_name: name of parent group
+
+        Returns:
+            The group preferences or None if the group does not exist
+        """
+        with self._lock:
+            self._migrate()
+            if group_name in self._pending_deletes:
+                return None
+
+            group_preferences = self._pending_groups.get(group_name, None)
+            if group_preferences is not None:
+                self.hits += 1
+                return group_preferences
+
+            json_file = self._group_file(group_name)
+            group_preferences = self._read(json_file)
+            if not json_file.exists():
+                return None
+            return group_preferences
+
+    def write_group(self, group_name: str, group_preferences: dict):
+        """Writes the preferences of a single group, only that group's file is rewritten
+
+        Args:
+            group_name: name of parent group
+            group_preferences: the new preferences for the group
+        """
+        with self._lock:
+            self._migrate()
+            if group_name in self._pending_groups:
+                self.coalesced_writes += 1
+            self._pending_groups[group_name] = group_preferences
+            self._pending_deletes.discard(group_name)
+            self._schedule_write()
+
+    def write_all(self, preferences: dict):
+        """Replaces all preferences, groups that are not in preferences are deleted
+
+        Args:
+            preferences: the full preferences dictionary
+        """
+        with self._lock:
+            self._migrate()
+            if self._has_pending():
+                self.coalesced_writes += 1
+            self._pending_deletes = (self._stored_group_names() | set(self._pending_groups)) - set(preferences)
+            self._pending_groups = dict(preferences)
+            self._schedule_write()
+
+    def _write_pending(self):
+        for group_name in list(self._pending_deletes):
+            self._group_file(group_name).remove()
+            self._files.pop(group_name, None)
+            self._pending_deletes.discard(group_name)
+
+        for group_name in list(self._pending_groups):
+            self._group_file(group_name).write(self._pending_groups[group_name])
+            del self._pending_groups[group_name]
+            self.writes += 1
+
+    def _discard(self):
+        self._pending_groups = {}
+        self._pending_deletes = set()
+        self._files = {}
@@ -0,0 +1,158 @@
+"""
+Fusion360PreviewCache.py
+========================
+Python module for reusing the results of a command preview
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import sys
+from collections import OrderedDict
+
+from typing import Any, Callable, Optional
+
+
+def approximate_size(value: Any) -> int:
+    """Approximate memory size of a value in bytes
+
+    Lists, tuples, sets and dictionaries are measured along with their contents.
+    Fusion 360 objects such as temporary BRep bodies are only measured by their Python wrapper,
+    pass an explicit size to :meth:`PreviewCache.set` if they should count for more.
+
+    Args:
+        value: Any python object
+
+    Returns:
+        The approximate size in bytes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += approximate_size(key) + approximate_size(item)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += approximate_size(item)
+    return size
+
+
+class PreviewCache:
+    """Least recently used cache of the data computed by a preview
+
+    The cache is bounded by its number of entries and, optionally, by the approximate total size of its values.
+    When either bound is exceeded the least recently used entries are evicted.
+
+    Args:
+        max_entries: Maximum number of entries to keep
+        max_bytes: Maximum approximate size of all values in bytes, if None the size is not limited
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Gets a cached value and marks it as most recently used
+
+        Args:
+            key: The key of the value, typically an input fingerprint
+            default: Returned if the key is not in the cache
+
+        Returns:
+            The cached value or default
+        """
+        entry = self._entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, key: Any, value: Any, size: Optional[int] = None):
+        """Stores a value, evicting the least recently used values if the cache is full
+
+        Args:
+            key: The key of the value, typically an input fingerprint
+            value: The data to cache
+            size: Size of the value in bytes, if None it is estimated with :func:`approximate_size`
+        """
+        if size is None:
+            size = approximate_size(value)
+
+        self.remove(key)
+
+        # A value that could never fit is not cached at all
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, size)
+        self.size += size
+
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self.size > self.max_bytes):
+            old_key, (old_value, old_size) = self._entries.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+
+    def get_or_compute(self, key: Any, compute: Callable[[], Any], size: Optional[int] = None) -> Any:
+        """Gets a cached value or computes and stores it
+
+        Args:
+            key: The key of the value, typically an input fingerprint
+            compute: Function with no arguments that computes the value
+            size: Size of the value in bytes, if None it is estimated with :func:`approximate_size`
+
+        Returns:
+            The cached or newly computed value
+        """
+        entry = self._entries.get(key, None)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        value = compute()
+        self.set(key, value, size)
+        return value
+
+    def remove(self, key: Any):
+        """Removes a value from the cache if it is present
+
+        Args:
+            key: The key of the value
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def clear(self):
+        """Removes all values from the cache"""
+        self._entries.clear()
+        self.size = 0
+
+    def get_stats(self) -> dict:
+        """Cache statistics
+
+        Returns:
+            A dictionary with the number of entries, their approximate size, cache hits, misses and evictions
+        """
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
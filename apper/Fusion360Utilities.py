@@ -14,13 +14,14 @@ import adsk.cam
 import os
 import sys
 from os.path import expanduser
-import json
 import uuid
 import time
 
 from contextlib import ContextDecorator
 from typing import Optional, List, Union
 
+from .Fusion360Preferences import PreferenceStore
+
 
 # Class to quickly access Fusion Application Objects
 # TODO Doc string
@@ -461,25 +462,71 @@ def combine_feature(target_body: adsk.fusion.BRepBody, tool_bodies: List[adsk.fu
     combine_features.add(combine_input)
 
 
-# Get default directory
-def get_default_dir(app_name: str):
-    """Creates a directory in the user's home folder to store data related to this app
+class _AppPaths:
+    """Resolves the files and directories used to store data for an app
+
+    Each directory is resolved and created only once, the results are cached for the life of the session.
 
     Args:
-        app_name (str): Name of the Application
+        app_name: Name of the Application
     """
 
-    # Get user's home directory
-    default_dir = expanduser("~")
+    def __init__(self, app_name: str):
+        self.app_name = app_name
+        self._default_dir = None
+        self._log_dir = None
+        self._settings_file = None
+        self._settings_store = None
 
-    # Create a subdirectory for this application settings
-    default_dir = os.path.join(default_dir, app_name, "")
+    @property
+    def default_dir(self) -> str:
+        if self._default_dir is None:
+            # Create a subdirectory of the user's home directory for this application settings
+            default_dir = os.path.join(expanduser("~"), self.app_name, "")
+            os.makedirs(default_dir, exist_ok=True)
+            self._default_dir = default_dir
+        return self._default_dir
 
-    # Create the folder if it does not exist    
-    if not os.path.exists(default_dir):
-        os.makedirs(default_dir)
+    @property
+    def log_dir(self) -> str:
+        if self._log_dir is None:
+            log_dir = os.path.join(self.default_dir, "logs", "")
+            os.makedirs(log_dir, exist_ok=True)
+            self._log_dir = log_dir
+        return self._log_dir
+
+    @property
+    def settings_file(self) -> str:
+        if self._settings_file is None:
+            self._settings_file = os.path.join(self.default_dir, ".settings.json")
+        return self._settings_file
+
+    @property
+    def settings_store(self) -> PreferenceStore:
+        if self._settings_store is None:
+            self._settings_store = PreferenceStore(self.settings_file)
+        return self._settings_store
 
-    return default_dir
+
+_app_paths = {}
+
+
+def _get_app_paths(app_name: str) -> _AppPaths:
+    app_paths = _app_paths.get(app_name, None)
+    if app_paths is None:
+        app_paths = _AppPaths(app_name)
+        _app_paths[app_name] = app_paths
+    return app_paths
+
+
+# Get default directory
+def get_default_dir(app_name: str):
+    """Creates a directory in the user's home folder to store data related to this app
+
+    Args:
+        app_name (str): Name of the Application
+    """
+    return _get_app_paths(app_name).default_dir
 
 
 def get_settings_file(app_name: str):
@@ -488,9 +535,7 @@ def get_settings_file(app_name: str):
     Args:
         app_name: Name of the Application
     """
-    default_dir = get_default_dir(app_name)
-    file_name = os.path.join(default_dir, ".settings.json")
-    return file_name
+    return _get_app_paths(app_name).settings_file
 
 
 # Write App Settings
@@ -501,32 +546,26 @@ def write_settings(app_name: str, settings: dict):
         app_name: Name of the Application
         settings: Stores a dictionary as a json string
     """
-    settings_text = json.dumps(settings)
-    file_name = get_settings_file(app_name)
-
-    f = open(file_name, "w")
-    f.write(settings_text)
-    f.close()
+    settings_store = _get_app_paths(app_name).settings_store
+    try:
+        settings_store.write_all(dict(settings))
+    except:
+        # Don't keep serving settings that were never written
+        settings_store.invalidate()
+        raise
 
 
 # Read App Settings
 def read_settings(app_name: str):
     """Read a settings file into the default directory for the app
 
+    The file is only parsed again if it changed since the last read.
+
     Args:
         app_name: Name of the Application
     """
-    file_name = get_settings_file(app_name)
-    if os.path.exists(file_name):
-        with open(file_name) as f:
-            try:
-                settings = json.load(f)
-            except:
-                settings = {}
-    else:
-        settings = {}
-
-    return settings
+    settings = _get_app_paths(app_name).settings_store.get_all()
+    return dict(settings)
 
 
 # Creates directory and returns file name for log file
@@ -536,12 +575,7 @@ def get_log_file_name(app_name: str):
     Args:
         app_name: Name of the Application
     """
-    default_dir = get_default_dir(app_name)
-
-    log_dir = os.path.join(default_dir, "logs", "")
-
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
+    log_dir = _get_app_paths(app_name).log_dir
 
     time_stamp = time.strftime("%Y-%m-%d-%H-%M-%S", time.gmtime())
 
@@ -658,8 +692,7 @@ def get_log_file(app_name: str):
     Args:
         app_name: Name of the Application
     """
-    default_dir = get_default_dir(app_name)
-    file_name = os.path.join(default_dir, "logger.log")
+    file_name = os.path.join(_get_app_paths(app_name).default_dir, "logger.log")
     return file_name
 
 
@@ -669,8 +702,7 @@ def get_std_out_file(app_name: str):
     Args:
         app_name: Name of the Application
     """
-    default_dir = get_default_dir(app_name)
-    file_name = os.path.join(default_dir, "std_out.txt")
+    file_name = os.path.join(_get_app_paths(app_name).default_dir, "std_out.txt")
     return file_name
 
 
@@ -680,8 +712,7 @@ def get_std_err_file(app_name: str):
     Args:
         app_name: Name of the Application
     """
-    default_dir = get_default_dir(app_name)
-    file_name = os.path.join(default_dir, "std_err.txt")
+    file_name = os.path.join(_get_app_paths(app_name).default_dir, "std_err.txt")
     return file_name
 
 
@@ -0,0 +1,157 @@
+"""
+Fusion360WorkerPool.py
+======================
+Python module for running the functions of custom threads in a bounded pool of worker threads
+~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+:copyright: (c) 2019 by Patrick Rainsberry.
+:license: Apache 2.0, see LICENSE for more details.
+
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+
+from typing import Callable, Optional
+
+from .Fusion360ErrorSink import report_error
+
+
+class WorkerPool:
+    """A bounded pool of worker threads shared by the custom threads of an add-in
+
+    Functions that loop until their stop flag is set keep a worker busy for as long as they run,
+    so max_workers should be at least the number of such threads that run at the same time.
+    Functions submitted while every worker is busy wait in a queue, see :meth:`get_stats`.
+
+    Args:
+        max_workers: Maximum number of worker threads, by default min(32, cpu count + 4)
+        thread_name_prefix: Prefix of the names of the worker threads
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, thread_name_prefix: str = 'apper_worker'):
+        if max_workers is None:
+            max_workers = min(32, (os.cpu_count() or 1) + 4)
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.active = 0
+        self.peak_active = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures = set()
+        self._lock = threading.Lock()
+
+    def submit(self, function: Callable, *args, **kwargs) -> Future:
+        """Runs a function in a worker thread
+
+        Errors raised by the function are reported to the error sink and set on the returned future,
+        the sink shows its notification on the main thread.
+
+        Args:
+            function: The function to run
+            *args: Positional arguments passed to the function
+            **kwargs: Keyword arguments passed to the function
+
+        Returns:
+            The future of the function
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, self.thread_name_prefix)
+            self.submitted += 1
+            future = self._executor.submit(self._run, function, args, kwargs)
+            self._futures.add(future)
+
+        future.add_done_callback(self._discard)
+        return future
+
+    def _run(self, function: Callable, args: tuple, kwargs: dict):
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+        try:
+            return function(*args, **kwargs)
+        except:
+            with self._lock:
+                self.failed += 1
+            report_error('Worker Thread Failed')
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def _discard(self, future: Future):
+        with self._lock:
+            self._futures.discard(future)
+            if future.cancelled():
+                self.cancelled += 1
+
+    def get_stats(self) -> dict:
+        """Utilization of the pool
+
+        Returns:
+            A dictionary with max_workers, the number of active and queued functions, the peak number of active
+            functions, the utilization (active / max_workers) and the number of submitted, completed, failed and
+            cancelled functions
+        """
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'active': self.active,
+                'queued': len(self._futures) - self.active,
+                'peak_active': self.peak_active,
+                'utilization': self.active / self.max_workers,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'cancelled': self.cancelled
+            }
+
+    def shutdown(self, timeout: Optional[float] = 5.0) -> bool:
+        """Cancels the queued functions and waits for the running ones to return
+
+        Running functions are not interrupted, set their stop flags before calling this.
+        The pool can be used again afterwards, new worker threads are then created.
+
+        Args:
+            timeout: Maximum number of seconds to wait, None waits until every function returned
+
+        Returns:
+            True if every running function returned within the timeout
+        """
+        with self._lock:
+            executor = self._executor
+            self._executor = None
+        if executor is None:
+            return True
+
+        # Cancelled here rather than with shutdown(cancel_futures=True), which needs Python 3.9
+        with self._lock:
+            futures = list(self._futures)
+        running = [future for future in futures if not future.cancel()]
+        executor.shutdown(wait=False)
+
+        not_done = wait(running, timeout).not_done
+        if not_done:
+            logging.getLogger('apper').warning(
+                "{} worker thread(s) of {} did not stop within {} seconds".format(
+                    len(not_done), self.thread_name_prefix, timeout
+                )
+            )
+        return not not_done
+
+
+_default_pool: Optional[WorkerPool] = None
+
+
+def get_default_worker_pool() -> WorkerPool:
+    """Returns the pool used by custom threads that do not belong to a FusionApp"""
+    global _default_pool
+
+    if _default_pool is None:
+        _default_pool = WorkerPool()
+    return _default_pool
@@ -7,17 +7,63 @@ Python module for creating a Fusion 360 Addin
 :license: Apache 2.0, see LICENSE for more details.
 
 """
+import importlib
 import logging
+import sys
+import threading
+import time
 import traceback
 
 import adsk.core
-import json
 
 import os
 from os.path import expanduser
 
 from typing import Optional, List, Union, Any, Iterable
 
+from .Fusion360Preferences import PreferenceStore, ShardedPreferenceStore, read_json_file
+
+
+class UILookupCache:
+    """Memoizes user interface lookups made while the commands of an add-in are registered
+
+    Workspaces, toolbar tabs, toolbar panels, control collections and drop downs are typically shared by many commands.
+    Each one is looked up (or created) once and then reused for the rest of the registration.
+    """
+
+    def __init__(self):
+        self.api_calls_avoided = 0
+        self._items = {}
+
+    def get(self, key: tuple, api_calls: int, lookup):
+        """Gets a cached item or looks it up
+
+        Args:
+            key: Unique key for the item
+            api_calls: Number of Fusion API calls that the lookup would make
+            lookup: Function with no arguments that returns the item, or None if it does not exist
+
+        Returns:
+            The item or None if it does not exist
+        """
+        item = self._items.get(key, None)
+        if item is None:
+            item = lookup()
+            if item is not None:
+                self._items[key] = item
+        else:
+            self.api_calls_avoided += api_calls
+        return item
+
+    def set(self, key: tuple, item: Any):
+        """Stores a newly created item
+
+        Args:
+            key: Unique key for the item
+            item: The created item
+        """
+        self._items[key] = item
+
 
 class FusionApp:
     """Base class for creating a Fusion 360 Add-in
@@ -36,14 +82,69 @@ class FusionApp:
         self.events = []
         self.features = []
         self.tabs = []
-        self.default_dir = self._get_default_dir()
-        self.preferences = self.get_all_preferences()
+        self._default_dir: Optional[str] = None
+        self._preferences: Optional[dict] = None
+        self._store: Optional[PreferenceStore] = None
+        self._sharded_preferences = False
+        self._preference_write_delay: Optional[float] = None
         self.root_path = ''
         self.command_dict = {}
         self.custom_toolbar_tab = True
+        self.lazy_commands = False
+        self.startup_times = {}
+        self.run_app_time: Optional[float] = None
+        self.ui_cache: Optional[UILookupCache] = None
+        self.ui_api_calls_avoided = 0
+        self.metrics_enabled = False
+        self.max_background_workers: Optional[int] = None
+        self.background_jobs = None
+        self.max_worker_threads: Optional[int] = None
+        self.worker_shutdown_timeout = 5.0
+        self.worker_pool = None
         self.logger: Optional[logging.Logger] = None
         self.logging_enabled = False
 
+    @property
+    def default_dir(self) -> str:
+        """Directory in the user's home folder to store data related to this app
+
+        The directory is created on first access.
+        """
+        if self._default_dir is None:
+            self._default_dir = self._get_default_dir()
+        return self._default_dir
+
+    @default_dir.setter
+    def default_dir(self, value: str):
+        self._default_dir = value
+
+    @property
+    def preferences(self) -> dict:
+        """All preferences stored for this application, read on first access"""
+        if self._preferences is None:
+            self._preferences = self.get_all_preferences()
+        return self._preferences
+
+    @preferences.setter
+    def preferences(self, value: dict):
+        self._preferences = value
+
+    @property
+    def _preference_store(self) -> PreferenceStore:
+        if self._store is None:
+            if self._sharded_preferences:
+                self._store = ShardedPreferenceStore(
+                    os.path.join(self.default_dir, "preferences", ""),
+                    legacy_file_name=os.path.join(self.default_dir, "preferences.json"),
+                    write_delay=self._preference_write_delay
+                )
+            else:
+                self._store = PreferenceStore(
+                    os.path.join(self.default_dir, "preferences.json"),
+                    write_delay=self._preference_write_delay
+                )
+        return self._store
+
     def add_command(
             self,
             name: str,
@@ -52,6 +153,11 @@ class FusionApp:
     ):
         """Adds a command to the application
 
+        If options['lazy_load'] (or lazy_commands on the app) is True only the command button is created at startup.
+        The command object is constructed the first time the command is clicked.
+        In that case command_class can also be an import path (i.e. 'commands.MyCommand.MyCommand')
+        so that the command module is not imported until it is needed.
+
         Args:
             name: The name of the command
             command_class: This should be your subclass of apper.Fusion360CommandBase or apper.PaletteCommandBase
@@ -87,25 +193,20 @@ class FusionApp:
                     _this_tab_id = options['toolbar_tab_id'] + '_' + _workspace
                     options['toolbar_tab_id'] = _this_tab_id
 
-                command = command_class(name, options)
+                command = self._create_command(name, command_class, options)
 
                 self.commands.append(command)
                 self.command_dict[base_cmd_id] = new_id
 
             elif isinstance(_workspace, Iterable):
                 if all(isinstance(item, str) for item in _workspace):
-                    for workspace in _workspace:
-                        options['workspace'] = workspace
-
-                        _this_id = new_id + '_' + workspace
-                        options['cmd_ctrl_id'] = _this_id
-
-                        _this_tab_id = options['toolbar_tab_id'] + '_' + workspace
-                        options['toolbar_tab_id'] = _this_tab_id
+                    # One command object and definition, with a control placed in each workspace
+                    options['workspace'] = list(_workspace)
+                    options['toolbar_tab_per_workspace'] = self.custom_toolbar_tab
 
-                        command = command_class(name, options)
-                        self.commands.append(command)
-                        self.command_dict[base_cmd_id] = new_id
+                    command = self._create_command(name, command_class, options)
+                    self.commands.append(command)
+                    self.command_dict[base_cmd_id] = new_id
             else:
                 raise TypeError  # TODO or something along that line
 
@@ -113,6 +214,243 @@ class FusionApp:
             if ui:
                 ui.messageBox('Apper Add Command failed: {}'.format(traceback.format_exc()))
 
+    def _create_command(self, name: str, command_class: Any, options: dict):
+        start_time = time.perf_counter()
+
+        if options.get('lazy_load', self.lazy_commands):
+            from .Fusion360CommandBase import _LazyCommand
+            command = _LazyCommand(name, dict(options), command_class)
+        else:
+            command = command_class(name, options)
+
+        self.startup_times[command.cmd_ctrl_id] = {'create_time': time.perf_counter() - start_time}
+        return command
+
+    def get_startup_report(self) -> dict:
+        """Reports the time spent starting each command
+
+        For lazily loaded commands "materialize_time" is the construction time that was deferred
+        from startup to the first time the command was clicked (None if it has not been clicked yet).
+
+        Returns:
+            A dictionary with the total "run_app_time", the number of user interface API calls avoided by
+            sharing lookups between commands and the timings of each command keyed by its control id
+        """
+        commands = {}
+        for command in self.commands:
+            command_times = dict(self.startup_times.get(command.cmd_ctrl_id, {}))
+            command_times['lazy'] = hasattr(command, 'materialize')
+            if command_times['lazy']:
+                command_times['materialize_time'] = command.materialize_time
+            commands[command.cmd_ctrl_id] = command_times
+
+        return {
+            'run_app_time': self.run_app_time,
+            'ui_api_calls_avoided': self.ui_api_calls_avoided,
+            'commands': commands
+        }
+
+    def get_background_job_runner(self):
+        """Returns the runner of the background jobs of all commands, created the first time it is needed
+
+        Set max_background_workers before the first job is started to limit the number of worker threads.
+
+        Returns:
+            A :class:`BackgroundJobRunner`
+        """
+        if self.background_jobs is None:
+            from .Fusion360BackgroundJobs import BackgroundJobRunner
+            event_id = self.company + "_" + self.name + "_background_jobs"
+            self.background_jobs = BackgroundJobRunner(event_id, self.max_background_workers)
+        return self.background_jobs
+
+    def start_background_job(self, command: Any, data: Any):
+        """Runs the compute step of a command in a worker thread, apply is then called on the main thread
+
+        Args:
+            command: The command, see Fusion360CommandBase.compute
+            data: The plain data returned by the command's gather
+
+        Returns:
+            The started :class:`BackgroundJob`
+        """
+        return self.get_background_job_runner().start(command, data)
+
+    def get_worker_pool(self):
+        """Returns the pool that runs the threads of the custom events of this app, created the first time it is needed
+
+        Set max_worker_threads before the first thread is started to change the number of worker threads.
+        Each custom thread that loops until it is stopped keeps one worker busy.
+
+        Returns:
+            A :class:`WorkerPool`
+        """
+        if self.worker_pool is None:
+            from .Fusion360WorkerPool import WorkerPool
+            from .Fusion360ErrorSink import get_error_sink
+            self.worker_pool = WorkerPool(self.max_worker_threads, self.company + "_" + self.name + "_worker")
+
+            # Errors of the worker threads are shown from the main thread
+            error_sink = get_error_sink()
+            if error_sink.notify_event_id is None and threading.current_thread() is threading.main_thread():
+                error_sink.register_notify_event(self.company + "_" + self.name + "_errors")
+        return self.worker_pool
+
+    def get_worker_pool_stats(self) -> dict:
+        """Utilization of the worker pool, see :meth:`WorkerPool.get_stats`
+
+        Returns:
+            The statistics of the pool, an empty dictionary if no thread was started
+        """
+        if self.worker_pool is None:
+            return {}
+        return self.worker_pool.get_stats()
+
+    def enable_metrics(self, enabled: bool = True):
+        """Records the latency of every command event
+
+        For each event of each command, the time spent in apper (i.e. reading the input values) and
+        the time spent in your method (i.e. on_preview) are recorded separately.
+        When disabled, the default, the overhead is a single attribute check per event.
+
+        Args:
+            enabled: Set to False to stop recording and discard the recorded metrics
+        """
+        self.metrics_enabled = enabled
+        for command in self.commands:
+            command.set_metrics_enabled(enabled)
+
+    def get_metrics(self) -> dict:
+        """Gets the latency metrics of all commands, see :meth:`enable_metrics`
+
+        Returns:
+            A dictionary keyed by command control id, then by event name, then by 'framework' or 'callback'.
+            Each entry has the count, p50, p95 and max latency in seconds.
+        """
+        metrics = {}
+        for command in self.commands:
+            command_metrics = command.get_metrics()
+            if command_metrics is not None:
+                metrics[command.cmd_ctrl_id] = command_metrics
+        return metrics
+
+    def dump_metrics_json(self, file_name: str):
+        """Writes the latency metrics of all commands to a json file
+
+        Args:
+            file_name: full path to the json file
+        """
+        from .Fusion360Metrics import write_metrics_json
+        write_metrics_json(file_name, self.get_metrics())
+
+    def dump_metrics_csv(self, file_name: str):
+        """Writes the latency metrics of all commands to a csv file, one row per event and part
+
+        Args:
+            file_name: full path to the csv file
+        """
+        from .Fusion360Metrics import write_metrics_csv
+        write_metrics_csv(file_name, self.get_metrics())
+
+    def reload_command(self, base_cmd_id: str) -> Any:
+        """Reloads a single command from its module without restarting the add-in
+
+        The module of the command class is re-imported and a new command object replaces the old one.
+        The existing command definition and controls are reused and only the commandCreated handler is swapped,
+        all other commands and their user interface are left untouched.
+
+        Note: the command will not pick up changes to its options (i.e. placement in the UI).
+
+        Args:
+            base_cmd_id: this is the value set in options for cmd_id
+
+        Returns:
+            The new command object, or None if reloading failed
+        """
+        app = adsk.core.Application.cast(adsk.core.Application.get())
+        ui = app.userInterface
+
+        try:
+            start_time = time.perf_counter()
+
+            cmd_id = self.command_id_from_name(base_cmd_id)
+            index, command = next(
+                (index, command) for index, command in enumerate(self.commands) if command.cmd_id == cmd_id
+            )
+
+            if hasattr(command, 'materialize'):
+                command.reload()
+                new_command = command
+            else:
+                module = importlib.reload(sys.modules[command.__class__.__module__])
+                command_class = getattr(module, command.__class__.__name__)
+
+                new_command = command_class(command.cmd_name, command.options)
+                new_command.replace_command(command)
+                self.commands[index] = new_command
+
+            if self.logging_enabled:
+                self.logger.info(f"Command {base_cmd_id} reloaded in {time.perf_counter() - start_time:.4f}s")
+            return new_command
+
+        except:
+            if ui:
+                ui.messageBox('Apper Reload Command failed: {}'.format(traceback.format_exc()))
+            return None
+
+    def get_command(self, base_cmd_id: str) -> Any:
+        """Returns the command object of a command, a lazily loaded command is constructed if necessary
+
+        Args:
+            base_cmd_id: this is the value set in options for cmd_id
+
+        Returns:
+            The command object or None if there is no such command
+        """
+        cmd_id = self.command_id_from_name(base_cmd_id)
+        for command in self.commands:
+            if command.cmd_id == cmd_id:
+                if hasattr(command, 'materialize'):
+                    return command.materialize()
+                return command
+        return None
+
+    def execute_command(self, base_cmd_id: str, input_values: dict) -> dict:
+        """Runs the on_execute of a command without its dialog, for batch automation
+
+        The command dialog, preview and validation are skipped, see Fusion360CommandBase.execute_headless.
+        Commands that execute in the background run gather, compute and apply synchronously instead.
+        Call this repeatedly to run the same command on many parts or parameter sets.
+        Errors raised by on_execute are not caught.
+
+        Args:
+            base_cmd_id: this is the value set in options for cmd_id
+            input_values: The value of each input keyed by input id
+
+        Returns:
+            A dictionary with the "result" returned by on_execute (or compute) and the execution "time" in seconds
+        """
+        command = self.get_command(base_cmd_id)
+        if command is None:
+            raise KeyError("No command with cmd_id: {}".format(base_cmd_id))
+
+        result = command.execute_headless(input_values)
+        return {'result': result, 'time': command.last_execution_time}
+
+    def run_batch(self, base_cmd_id: str, input_file_name: str, output_file_name: str) -> dict:
+        """Runs a command headless for every row of a CSV or JSON lines file, see :class:`BatchRunner`
+
+        Args:
+            base_cmd_id: this is the value set in options for cmd_id
+            input_file_name: full path to a .csv file with a header row or a JSON lines file
+            output_file_name: full path to the results file, written as CSV if it ends in .csv, otherwise JSON lines
+
+        Returns:
+            A dictionary with the number of "rows", "succeeded" and "failed" rows and the total "time" in seconds
+        """
+        from .Fusion360BatchRunner import BatchRunner
+        return BatchRunner(self, base_cmd_id).run(input_file_name, output_file_name)
+
     def command_id_from_name(self, name: str) -> Optional[str]:
         """Returns the full cmd_id defined by apper
 
@@ -146,10 +484,14 @@ class FusionApp:
             auto_start: Whether the thread should start when the addin starts
         """
 
-        custom_event = event_class(event_id, auto_start)
+        # The thread is started once the event knows the app, so it runs in the worker pool of this app
+        custom_event = event_class(event_id, False)
         custom_event.fusion_app = self
         self.events.append(custom_event)
 
+        if auto_start:
+            custom_event.start_thread()
+
     def add_custom_event_no_thread(self, event_id: str, event_class: Any):
         """Register a custom event
 
@@ -219,6 +561,35 @@ class FusionApp:
         self.features.append(custom_feature)
         return custom_feature
 
+    def get_handler_count(self) -> int:
+        """Returns the number of Fusion 360 event handlers the add-in currently keeps alive
+
+        Useful to check that handlers are released, the count should not grow as commands are used.
+
+        Returns:
+            The number of live handlers of all commands, events and custom features
+        """
+        count = 0
+        for command in self.commands:
+            count += command.get_handler_count()
+
+        # Each event keeps a single handler
+        count += len(self.events)
+
+        if self.background_jobs is not None:
+            count += self.background_jobs.get_handler_count()
+
+        if self.worker_pool is not None:
+            from .Fusion360ErrorSink import get_error_sink
+            if get_error_sink().notify_handler is not None:
+                count += 1
+
+        for feature in self.features:
+            if feature.compute_handler is not None:
+                count += 1
+
+        return count
+
     def check_for_updates(self):
         """Not Implemented"""
         pass
@@ -229,14 +600,26 @@ class FusionApp:
         app = adsk.core.Application.cast(adsk.core.Application.get())
         ui = app.userInterface
         try:
+            run_start_time = time.perf_counter()
+            self.ui_cache = UILookupCache()
+
             for run_command in self.commands:
+                start_time = time.perf_counter()
                 run_command.on_run()
+                command_times = self.startup_times.setdefault(run_command.cmd_ctrl_id, {})
+                command_times['on_run_time'] = time.perf_counter() - start_time
 
             for run_feature in self.features:
                 run_feature.on_run()
+
+            self.run_app_time = time.perf_counter() - run_start_time
         except:
             if ui:
                 ui.messageBox('Running App failed: {}'.format(traceback.format_exc()))
+        finally:
+            if self.ui_cache is not None:
+                self.ui_api_calls_avoided = self.ui_cache.api_calls_avoided
+            self.ui_cache = None
 
     def stop_app(self):
         """Stops the Addin and cleans up all of the created UI elements"""
@@ -255,10 +638,26 @@ class FusionApp:
             for event in self.events:
                 event.on_stop()
 
+            if self.background_jobs is not None:
+                self.background_jobs.stop()
+
         except:
             if ui:
                 ui.messageBox('Input changed event failed: {}'.format(traceback.format_exc()))
 
+        finally:
+            # Worker threads and preferences are cleaned up even if stopping anything above failed
+            try:
+                # Stop flags of the custom threads are set by on_stop above
+                if self.worker_pool is not None:
+                    try:
+                        self.worker_pool.shutdown(self.worker_shutdown_timeout)
+                    finally:
+                        from .Fusion360ErrorSink import get_error_sink
+                        get_error_sink().unregister_notify_event()
+            finally:
+                self.flush_preferences()
+
     # Get default directory
     def _get_default_dir(self):
 
@@ -269,21 +668,24 @@ class FusionApp:
         default_dir = os.path.join(default_dir, self.name, "")
 
         # Create the folder if it does not exist
-        if not os.path.exists(default_dir):
-            os.makedirs(default_dir)
+        os.makedirs(default_dir, exist_ok=True)
 
         return default_dir
 
     def get_all_preferences(self) -> dict:
         """Gets all preferences stored for this application
 
+        The preferences file is only read from disk if it changed since the last call.
+
         Returns:
             All preferences as a dictionary
         """
-        file_name = os.path.join(self.default_dir, "preferences.json")
-        all_preferences = self.read_json_file(file_name)
+        all_preferences = self._preference_store.get_all()
 
-        return all_preferences
+        return {
+            group_name: dict(group) if isinstance(group, dict) else group
+            for group_name, group in all_preferences.items()
+        }
 
     @staticmethod
     def read_json_file(file_name):
@@ -294,16 +696,7 @@ class FusionApp:
         Returns:
             Input file as a dictionary
         """
-        if os.path.exists(file_name):
-            with open(file_name) as f:
-                try:
-                    new_dict = json.load(f)
-                except:
-                    new_dict = {}
-        else:
-            new_dict = {}
-
-        return new_dict
+        return read_json_file(file_name)
 
     def get_group_preferences(self, group_name: str) -> dict:
         """Gets preferences for a particular group (typically a given command)
@@ -314,9 +707,10 @@ class FusionApp:
         Returns:
             A dictionary of just the options associated to this particular group
         """
-        all_preferences = self.get_all_preferences()
-        group_preferences = all_preferences.get(group_name, {})
-        return group_preferences
+        group_preferences = self._preference_store.get_group(group_name)
+        if group_preferences is None:
+            return {}
+        return dict(group_preferences)
 
     def save_preferences(self, group_name: str, new_group_preferences: dict, merge: bool):
         """Saves preferences for the application
@@ -331,35 +725,100 @@ class FusionApp:
 
         """
 
-        all_preferences = self.get_all_preferences()
-
-        old_group_preferences = all_preferences.get(group_name, None)
+        old_group_preferences = self._preference_store.get_group(group_name)
 
         if old_group_preferences is not None:
             result = "Updated"
         else:
             result = "Created"
 
-        if merge:
-            old_group_preferences.update(new_group_preferences)
-            all_preferences[group_name] = old_group_preferences
+        # Copy before modifying, the store returns its cached objects
+        if merge and old_group_preferences is not None:
+            group_preferences = dict(old_group_preferences)
+            group_preferences.update(new_group_preferences)
         else:
-            all_preferences[group_name] = new_group_preferences
+            group_preferences = new_group_preferences
 
-        if not self._write_preferences(all_preferences):
+        if not self._write_group_preferences(group_name, group_preferences):
             result = "Failed"
         return result
 
-    def _write_preferences(self, preferences_dict: dict):
-        file_name = os.path.join(self.default_dir, "preferences.json")
+    def enable_preference_write_behind(self, write_delay: float = 0.5):
+        """Defers writing preferences to disk
+
+        Successive calls to save_preferences are coalesced in memory and written to disk once no new
+        preferences have been saved for write_delay seconds, when flush_preferences is called or when the app stops.
+
+        Args:
+            write_delay: Seconds to wait after the last save before writing to disk
+        """
+        self._preference_write_delay = write_delay
+        if self._store is not None:
+            self._store.write_delay = write_delay
+
+    def flush_preferences(self) -> bool:
+        """Immediately writes any preferences that are waiting to be written to disk
+
+        Returns:
+            True if successful and False if it failed
+        """
+        if self._store is None:
+            return True
+
+        file_name = self._store.file_name
+        try:
+            self._store.flush()
+            return True
+        except:
+            if self.logging_enabled:
+                self.logger.error(f"Preference file write failed for: {file_name}")
+            return False
+
+    def get_preference_cache_stats(self) -> dict:
+        """Gets statistics for the in memory preferences cache
+
+        Returns:
+            A dictionary with the number of cache "hits", "misses" (reads from disk), "writes" to disk
+            and "coalesced_writes" that were merged into a later write
+        """
+        return self._preference_store.get_stats()
+
+    def enable_sharded_preferences(self):
+        """Stores each preference group in its own file
+
+        Saving a group then only rewrites that group's file.
+        Preferences already stored in preferences.json are migrated on first use.
+        """
+        if self._sharded_preferences:
+            return
+
+        self._sharded_preferences = True
+        if self._store is not None:
+            self.flush_preferences()
+            self._store = None
+
+    def _write_group_preferences(self, group_name: str, group_preferences: dict):
+        file_name = self._preference_store.file_name
         try:
-            preferences_text = json.dumps(preferences_dict)
-            with open(file_name, "w") as f:
-                f.write(preferences_text)
+            self._preference_store.write_group(group_name, group_preferences)
+            if self.logging_enabled and self._preference_store.write_delay is None:
+                self.logger.info(f"Preference file written at: {file_name}")
+            return True
+        except:
+            self._preference_store.invalidate()
             if self.logging_enabled:
+                self.logger.error(f"Preference file creation failed for: {file_name}")
+            return False
+
+    def _write_preferences(self, preferences_dict: dict):
+        file_name = self._preference_store.file_name
+        try:
+            self._preference_store.write_all(preferences_dict)
+            if self.logging_enabled and self._preference_store.write_delay is None:
                 self.logger.info(f"Preference file written at: {file_name}")
             return True
         except:
+            self._preference_store.invalidate()
             if self.logging_enabled:
                 self.logger.error(f"Preference file creation failed for: {file_name}")
             return False
@@ -375,8 +834,8 @@ class FusionApp:
             A string with possible values: "Created", "Exists", or "Failed"
 
         """
-        file_name = os.path.join(self.default_dir, "preferences.json")
-        if (not os.path.exists(file_name)) or force:
+        file_name = self._preference_store.file_name
+        if (not self._preference_store.exists()) or force:
             if self._write_preferences(defaults):
                 result = "Created"
                 if self.logging_enabled:
@@ -405,4 +864,17 @@ class FusionApp:
         self.logger.addHandler(handler)
         self.logging_enabled = True
 
+        # Errors raised in event handlers are logged to the same file
+        from .Fusion360ErrorSink import get_error_sink
+        get_error_sink().logger = self.logger
+
+    def get_error_summary(self) -> list:
+        """Summary of the errors raised in event handlers, see :meth:`ErrorSink.get_summary`
+
+        Returns:
+            A list of dictionaries with the context, exception and number of occurrences of each error
+        """
+        from .Fusion360ErrorSink import get_error_sink
+        return get_error_sink().get_summary()
+
 
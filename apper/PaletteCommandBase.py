@@ -7,14 +7,15 @@ Python module for creating an HTML Palette based command
 :license: Apache 2.0, see LICENSE for more details.
 
 """
-import traceback
 from urllib.parse import urlparse
 
 import adsk.core
 
 import os
 from .Fusion360CommandBase import Fusion360CommandBase
+from .Fusion360ErrorSink import report_error
 
+# Handlers are kept by the command object, see PaletteCommandBase.palette_handlers
 handlers = []
 
 
@@ -65,7 +66,7 @@ class PaletteCommandBase(Fusion360CommandBase):
 
         self.palette = None
         self.args = None
-        self.handlers = []
+        self.palette_handlers = []
         self.html_handlers = []
 
     def _get_create_event(self):
@@ -92,6 +93,13 @@ class PaletteCommandBase(Fusion360CommandBase):
         """
         pass
 
+    def _create_dialog_handlers(self) -> list:
+        return [('execute', _PaletteExecuteHandler(self))]
+
+    def get_handler_count(self) -> int:
+        """Returns the number of event handlers this command and its palette currently keep alive"""
+        return super().get_handler_count() + len(self.palette_handlers)
+
     def on_stop(self):
         """Function is run when the addin stops.
 
@@ -109,6 +117,9 @@ class PaletteCommandBase(Fusion360CommandBase):
         if palette:
             palette.deleteMe()
 
+        self.palette_handlers = []
+        self.html_handlers = []
+
         super().on_stop()
 
 
@@ -134,16 +145,13 @@ class _PaletteCreatedHandler(adsk.core.CommandCreatedEventHandler):
             command = args.command
             inputs = command.commandInputs
 
-            on_execute_handler = _PaletteExecuteHandler(self.cmd_object)
-            command.execute.add(on_execute_handler)
-            handlers.append(on_execute_handler)
+            for event_name, handler in self.cmd_object.get_dialog_handlers():
+                getattr(command, event_name).add(handler)
 
             self.cmd_object.on_create(command, inputs)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Command created failed: {}'.format(traceback.format_exc()))
+            report_error('Command created failed')
 
 
 class _PaletteExecuteHandler(adsk.core.CommandEventHandler):
@@ -186,13 +194,14 @@ class _PaletteExecuteHandler(adsk.core.CommandEventHandler):
                 # Add handler to HTMLEvent of the palette.
                 on_html_event_handler = _HTMLEventHandler(self.cmd_object)
                 palette.incomingFromHTML.add(on_html_event_handler)
-                handlers.append(on_html_event_handler)
-                self.cmd_object.html_handlers.append(on_html_event_handler)
+                self.cmd_object.html_handlers = [on_html_event_handler]
 
                 # Add handler to CloseEvent of the palette.
                 on_closed_handler = _PaletteCloseHandler(self.cmd_object)
                 palette.closed.add(on_closed_handler)
-                handlers.append(on_closed_handler)
+
+                # Handlers of a previous palette that was deleted are released
+                self.cmd_object.palette_handlers = [on_html_event_handler, on_closed_handler]
 
             else:
                 if not palette.isNative:
@@ -218,10 +227,7 @@ class _PaletteExecuteHandler(adsk.core.CommandEventHandler):
             self.cmd_object.on_palette_execute(palette)
 
         except:
-            ui.messageBox('Palette ({}) Execution Failed: {}'.format(
-                self.cmd_object.palette_html_file_url,
-                traceback.format_exc())
-            )
+            report_error('Palette ({}) Execution Failed'.format(self.cmd_object.palette_html_file_url))
 
 
 class _HTMLEventHandler(adsk.core.HTMLEventHandler):
@@ -246,9 +252,7 @@ class _HTMLEventHandler(adsk.core.HTMLEventHandler):
             self.cmd_object.on_html_event(html_args)
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed Handling HTML Event:\n{}'.format(traceback.format_exc()))
+            report_error('Failed Handling HTML Event')
 
 
 class _PaletteCloseHandler(adsk.core.UserInterfaceGeneralEventHandler):
@@ -272,6 +276,4 @@ class _PaletteCloseHandler(adsk.core.UserInterfaceGeneralEventHandler):
             self.cmd_object.on_palette_close()
 
         except:
-            app = adsk.core.Application.cast(adsk.core.Application.get())
-            ui = app.userInterface
-            ui.messageBox('Failed During Palette Close:\n{}'.format(traceback.format_exc()))
+            report_error('Failed During Palette Close')
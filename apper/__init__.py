@@ -11,23 +11,93 @@ Full documentation is at <https://apper.readthedocs.io>.
 
 """
 
-try:
-    from .FusionApp import FusionApp
-    from .Fusion360AppEvents import Fusion360CustomEvent
-    from .Fusion360AppEvents import Fusion360CustomThread
-    from .Fusion360AppEvents import Fusion360NewThread
-    from .Fusion360AppEvents import Fusion360DocumentEvent
-    from .Fusion360AppEvents import Fusion360WorkspaceEvent
-    from .Fusion360AppEvents import Fusion360WebRequestEvent
-    from .Fusion360AppEvents import Fusion360CommandEvent
-    from .Fusion360AppEvents import Fusion360ActiveSelectionEvent
-    from .Fusion360CommandBase import Fusion360CommandBase
-    from .PaletteCommandBase import PaletteCommandBase
-    from .Fusion360CustomFeatureBase import Fusion360CustomFeatureBase
-    from .Fusion360Utilities import AppObjects
-    from .Fusion360Utilities import *
-    from .Fusion360DebugUtilities import *
-    from .Fusion360PipInstaller import check_dependency, install_from_list, install_from_requirements
-
-except:
-    pass
+import importlib
+
+# Classes with the same name as their module are imported eagerly, so the name is never the module
+from .FusionApp import FusionApp
+from .Fusion360CommandBase import Fusion360CommandBase
+from .PaletteCommandBase import PaletteCommandBase
+from .Fusion360CustomFeatureBase import Fusion360CustomFeatureBase
+
+# Submodules are only imported the first time one of their attributes is accessed (PEP 562)
+_lazy_attributes = {
+    'Fusion360CustomEvent': 'Fusion360AppEvents',
+    'Fusion360CustomThread': 'Fusion360AppEvents',
+    'Fusion360NewThread': 'Fusion360AppEvents',
+    'Fusion360DocumentEvent': 'Fusion360AppEvents',
+    'Fusion360WorkspaceEvent': 'Fusion360AppEvents',
+    'Fusion360WebRequestEvent': 'Fusion360AppEvents',
+    'Fusion360CommandEvent': 'Fusion360AppEvents',
+    'Fusion360ActiveSelectionEvent': 'Fusion360AppEvents',
+    'PreviewCache': 'Fusion360PreviewCache',
+    'CommandMetrics': 'Fusion360Metrics',
+    'BackgroundJob': 'Fusion360BackgroundJobs',
+    'ErrorSink': 'Fusion360ErrorSink',
+    'BatchRunner': 'Fusion360BatchRunner',
+    'read_batch_rows': 'Fusion360BatchRunner',
+    'WorkerPool': 'Fusion360WorkerPool',
+    'get_error_sink': 'Fusion360ErrorSink',
+    'report_error': 'Fusion360ErrorSink',
+    'LatencyHistogram': 'Fusion360Metrics',
+    'AppObjects': 'Fusion360Utilities',
+    'lib_import': 'Fusion360Utilities',
+    'start_group': 'Fusion360Utilities',
+    'end_group': 'Fusion360Utilities',
+    'import_dxf': 'Fusion360Utilities',
+    'sketch_by_name': 'Fusion360Utilities',
+    'extrude_all_profiles': 'Fusion360Utilities',
+    'create_component': 'Fusion360Utilities',
+    'rect_body_pattern': 'Fusion360Utilities',
+    'combine_feature': 'Fusion360Utilities',
+    'get_default_dir': 'Fusion360Utilities',
+    'get_settings_file': 'Fusion360Utilities',
+    'write_settings': 'Fusion360Utilities',
+    'read_settings': 'Fusion360Utilities',
+    'open_doc': 'Fusion360Utilities',
+    'get_a_uuid': 'Fusion360Utilities',
+    'item_id': 'Fusion360Utilities',
+    'remove_item_id': 'Fusion360Utilities',
+    'get_item_by_id': 'Fusion360Utilities',
+    'get_log_file': 'Fusion360Utilities',
+    'get_std_out_file': 'Fusion360Utilities',
+    'get_std_err_file': 'Fusion360Utilities',
+    'ProgressDialog': 'Fusion360Utilities',
+    'variables_message': 'Fusion360DebugUtilities',
+    'variable_message': 'Fusion360DebugUtilities',
+    'perf_log': 'Fusion360DebugUtilities',
+    'perf_message': 'Fusion360DebugUtilities',
+    'get_log_file_name': 'Fusion360DebugUtilities',
+    'check_dependency': 'Fusion360PipInstaller',
+    'install_from_list': 'Fusion360PipInstaller',
+    'install_from_requirements': 'Fusion360PipInstaller',
+}
+
+# Star imports resolve the lazy names through __getattr__
+__all__ = ['FusionApp', 'Fusion360CommandBase', 'PaletteCommandBase', 'Fusion360CustomFeatureBase'] + list(_lazy_attributes)
+
+# Any other public name of these modules, previously exported with import *
+_star_modules = ['Fusion360DebugUtilities', 'Fusion360Utilities']
+
+
+def __getattr__(name: str):
+    module_name = _lazy_attributes.get(name, None)
+    if module_name is not None:
+        module = importlib.import_module('.' + module_name, __name__)
+        value = getattr(module, name)
+    elif not name.startswith('_'):
+        for module_name in _star_modules:
+            module = importlib.import_module('.' + module_name, __name__)
+            if hasattr(module, name):
+                value = getattr(module, name)
+                break
+        else:
+            raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_attributes))